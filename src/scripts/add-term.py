@@ -1,80 +1,182 @@
 import csv
+import json
+import os
 import sys
 
 from argparse import ArgumentParser
+from label_index import LabelIndex
+from templates import append_rows, delimiter, locked, read_headers
 from urllib.parse import parse_qs
 
 
 DEFAULTS = ["add", "branch", "branch-name", "project-name", "view-path"]
 
+INDEX = "src/ontology/templates/index.tsv"
 
-def main():
-	parser = ArgumentParser()
-	parser.add_argument("query_string")
-	args = parser.parse_args()
+# The label index that is checked for existing IDs in the index template,
+# and kept up to date with the rows that are added
+DATABASE = "build/label-index.db"
+
+# New IDs for imported terms without one
+ID_PREFIX = "ONTIE:"
+ID_DIGITS = 7
+
+
+def template_path(template):
+	return f"src/ontology/templates/{template}.tsv"
+
+
+def term_problems(template, term_id, fields, id_required=True):
+	"""Return a list of the reasons that a term cannot be added, without looking at the index."""
+	if not template:
+		return ["missing template name"]
+	problems = []
+	if not os.path.exists(template_path(template)):
+		problems.append(f"there is no template named {template}")
+	if id_required and not term_id:
+		problems.append("an ID is required")
+	if not fields.get("Label"):
+		problems.append("a Label is required")
+	return problems
 
-	fields = parse_qs(args.query_string)
+
+def parse_term(query_string):
+	"""Return the template, ID, and other fields of a term from a form query string.
+	Raise ValueError if one of them is missing."""
+	fields = parse_qs(query_string)
 	for default in DEFAULTS:
 		if default in fields:
 			del fields[default]
 
 	fields = {k: v[0] for k, v in fields.items()}
 
-	template = None
-	if "template" in fields:
-		template = fields["template"]
-		del fields["template"]
-	term_id = None
-	if "ID" in fields:
-		term_id = fields["ID"]
-		del fields["ID"]
+	template = fields.pop("template", None)
+	term_id = fields.pop("ID", None)
+
+	problems = term_problems(template, term_id, fields)
+	if problems:
+		raise ValueError(f"Unable to add term; {problems[0]}")
+	return template, term_id, fields
+
+
+def read_terms(path):
+	"""Read terms to import from a JSON Lines file (.jsonl) of objects,
+	or a TSV or CSV file with a header row, where each term has a template name,
+	an optional ID, and values by template header.
+	Return a list of (template, ID or None, fields) tuples.
+	Raise ValueError with every problem that is found in the file."""
+	with open(path, "r", newline="") as f:
+		if path.endswith(".jsonl"):
+			lines = enumerate(f, 1)
+			records = ((n, json.loads(line)) for n, line in lines if line.strip())
+		else:
+			records = enumerate(csv.DictReader(f, delimiter=delimiter(path)), 2)
+		terms = []
+		problems = []
+		headers = {}
+		for n, record in records:
+			fields = {k: str(v) for k, v in record.items() if k and v not in (None, "")}
+			template = fields.pop("template", None)
+			term_id = fields.pop("ID", None)
+			found = term_problems(template, term_id, fields, id_required=False)
+			if not found:
+				if template not in headers:
+					headers[template] = set(read_headers(template_path(template))[0])
+				for k in fields:
+					if k not in headers[template]:
+						found.append(f"template {template} has no column {k}")
+			problems.extend(f"line {n}: {problem}" for problem in found)
+			terms.append((template, term_id, fields))
+	if problems:
+		raise ValueError("\n".join(f"Unable to add term; {problem}" for problem in problems))
+	return terms
+
+
+def add_terms(terms, database=DATABASE):
+	"""Append terms, as (template, ID, fields) tuples, to the index and to their templates,
+	and return their IDs. Terms with no ID get the next free ones.
+	The index and templates stay locked from the duplicate check until the rows are written,
+	and each file is written once. Raise ValueError, and add nothing,
+	if an ID is already in the index template or in the batch.
+	Other templates in the label index are not checked,
+	so the result does not depend on which ones were indexed."""
+	index_rows = []
+	records = {INDEX: index_rows}
+	for template, term_id, fields in terms:
+		index_rows.append({"ID": term_id, "Label": fields["Label"], "Type": "owl:Class"})
+		records.setdefault(template_path(template), []).append(fields)
+
+	if os.path.dirname(database):
+		os.makedirs(os.path.dirname(database), exist_ok=True)
+	with locked(records) as fds:
+		labels = LabelIndex(database)
+		try:
+			# Only changes made to the index by something else are indexed here
+			labels.update([INDEX], forget=False)
+			problems = []
+			ids = {}
+			for row in index_rows:
+				term_id = row["ID"]
+				if term_id and (term_id in ids or labels.has_curie(term_id, INDEX)):
+					this_label = ids.get(term_id) or ", ".join(labels.labels(term_id, INDEX))
+					problems.append(f"a term already exists with ID {term_id} ({this_label})")
+				ids[term_id] = row["Label"]
+			if problems:
+				raise ValueError("\n".join(f"Unable to add term; {problem}" for problem in problems))
+
+			# Allocate the new IDs after the highest one in the index or this batch
+			number = labels.last_number(ID_PREFIX, ID_DIGITS, INDEX)
+			for term_id in ids:
+				if term_id and term_id.startswith(ID_PREFIX) and term_id[len(ID_PREFIX) :].isdigit():
+					number = max(number, int(term_id[len(ID_PREFIX) :]))
+			for row in index_rows:
+				if not row["ID"]:
+					number += 1
+					row["ID"] = f"{ID_PREFIX}{number:0{ID_DIGITS}d}"
+
+			for path, values in records.items():
+				before = os.fstat(fds[path])
+				headers, _ = read_headers(path)
+				rows = append_rows(path, fds[path], headers, values)
+				labels.append(path, before, rows)
+		finally:
+			labels.close()
+	return [row["ID"] for row in index_rows]
 
-	if not template:
-		print("Unable to add term; missing template name")
-		sys.exit(1)
-	if not term_id:
-		print("Unable to add term; an ID is required")
-		sys.exit(1)
-	if not fields.get("Label"):
-		print("Unable to add term; a Label is required")
+
+def main():
+	parser = ArgumentParser(description="Add terms from form query strings, or import them from a file")
+	parser.add_argument("query_string", nargs="*", help="One query string for each term to add")
+	parser.add_argument(
+		"-i",
+		"--import",
+		dest="import_path",
+		help="Path to a TSV, CSV, or JSON Lines (.jsonl) file of terms to add, "
+		"with a 'template' column, an optional 'ID' column, and template columns; "
+		"the IDs that are added are printed as TSV",
+	)
+	parser.add_argument("-d", "--database", default=DATABASE, help="Path to the label index")
+	args = parser.parse_args()
+	if not args.query_string and not args.import_path:
+		parser.error("a query string or an --import file is required")
+
+	try:
+		terms = [parse_term(query_string) for query_string in args.query_string]
+		if args.import_path:
+			terms += read_terms(args.import_path)
+		term_ids = add_terms(terms, args.database)
+	except ValueError as e:
+		print(e)
 		sys.exit(1)
 
-	template_path = f"src/ontology/templates/{template}.tsv"
-
-	rows = []
-	with open("src/ontology/templates/index.tsv", "r") as fr:
-		reader = csv.DictReader(fr, delimiter="\t")
-		header = reader.fieldnames
-		for row in reader:
-			this_id = row["ID"]
-			if this_id == term_id:
-				this_label = row["Label"]
-				print(f"Unable to add term; a term already exists with ID {term_id} ({this_label})")
-				sys.exit(1)
-			rows.append(row)
-	rows.append({"ID": term_id, "Label": fields.get("Label"), "Type": "owl:Class"})
-
-	with open("src/ontology/templates/index.tsv", "w") as fw:
-		writer = csv.DictWriter(fw, delimiter="\t", fieldnames=header, lineterminator="\n", extrasaction="ignore")
-		writer.writeheader()
-		writer.writerows(rows)
-
-	rows = []
-	with open(template_path, "r") as fr:
-		reader = csv.DictReader(fr, delimiter="\t")
-		header = reader.fieldnames
-		for row in reader:
-			rows.append(row)
-	rows.append(fields)
-
-	with open(template_path, "w") as fw:
-		writer = csv.DictWriter(fw, delimiter="\t", fieldnames=header, lineterminator="\n", extrasaction="ignore")
-		writer.writeheader()
-		writer.writerows(rows)
-
-	print(f"{term_id} successfully added to ONITE!")
+	if args.import_path:
+		print("ID\tLabel\ttemplate")
+		for term_id, (template, _, fields) in zip(term_ids, terms):
+			print(f"{term_id}\t{fields['Label']}\t{template}")
+	else:
+		for term_id in term_ids:
+			print(f"{term_id} successfully added to ONITE!")
 
 
 if __name__ == '__main__':
 	main()
-
@@ -1,7 +1,6 @@
-import csv
-
 from argparse import ArgumentParser
 from jinja2 import Template
+from templates import load_template
 
 
 def build_form_field(input_type, column, help_msg, required, value=None):
@@ -120,20 +119,19 @@ def build_message(message_content):
 def get_template_fields(template):
     metadata_fields = {"ID": {"type": "text", "required": "true"}}
     logic_fields = {}
-    with open(f"src/ontology/templates/{template}.tsv", "r") as f:
-        reader = csv.DictReader(f, delimiter="\t")
-        template_strings = next(reader)
-        for header, template in template_strings.items():
-            if template == "LABEL":
-                metadata_fields[header] = {"type": "text", "required": "true"}
-            elif template == "A definition":
-                metadata_fields[header] = {"type": "textarea", "required": "true"}
-            elif template.startswith("A"):
-                metadata_fields[header] = {"type": "text"}
-            elif template.strip() == "":
-                metadata_fields[header] = {"type": "text"}
-            else:
-                logic_fields[header] = {"type": "search"}
+    table = load_template(f"src/ontology/templates/{template}.tsv")
+    strings = table.strings + [""] * (len(table.headers) - len(table.strings))
+    for header, template in zip(table.headers, strings):
+        if template == "LABEL":
+            metadata_fields[header] = {"type": "text", "required": "true"}
+        elif template == "A definition":
+            metadata_fields[header] = {"type": "textarea", "required": "true"}
+        elif template.startswith("A"):
+            metadata_fields[header] = {"type": "text"}
+        elif template.strip() == "":
+            metadata_fields[header] = {"type": "text"}
+        else:
+            logic_fields[header] = {"type": "search"}
     return metadata_fields, logic_fields
 
 
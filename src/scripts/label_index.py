@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+#
+# A persistent SQLite index of the labels and alternative terms in the ROBOT templates,
+# with the IDs of their terms and the template rows that they come from.
+# Only templates that have changed since the last update are indexed again.
+
+import os
+import re
+import sqlite3
+import sys
+
+from argparse import ArgumentParser
+from templates import load_template, read_headers
+
+
+# Bump to rebuild index files written by older versions of this script
+SCHEMA_VERSION = 3
+
+# Annotation properties of alternative terms in template strings
+ALTERNATIVE_TERMS = {
+    "alternative term": "alternative term",
+    "IAO:0000118": "alternative term",
+    "IEDB alternative term": "IEDB alternative term",
+    "OBI:9991118": "IEDB alternative term",
+}
+
+# An annotation template string, e.g. "A alternative term SPLIT=|"
+ANNOTATION_PATTERN = re.compile(r"^A (.+?)(?: SPLIT=(\S+))?$")
+
+SCHEMA = """
+CREATE TABLE files (
+  path TEXT PRIMARY KEY,
+  mtime_ns INTEGER NOT NULL,
+  size INTEGER NOT NULL,
+  rows INTEGER NOT NULL  -- the number of data rows
+);
+-- One row for each label or alternative term in each template row
+CREATE TABLE names (
+  name TEXT NOT NULL,
+  kind TEXT NOT NULL,  -- label, alternative term, or IEDB alternative term
+  curie TEXT,          -- the ID in the same row, for templates with an ID column
+  label TEXT,          -- the label in the same row
+  path TEXT NOT NULL,
+  row INTEGER NOT NULL -- 1=headers, 2=template strings, 3=first term
+);
+CREATE INDEX names_name ON names (name);
+CREATE INDEX names_curie ON names (curie);
+CREATE INDEX names_label ON names (label);
+CREATE INDEX names_path ON names (path);
+-- One row for each template row with an ID, whether or not it has a label
+CREATE TABLE ids (
+  curie TEXT NOT NULL,
+  path TEXT NOT NULL,
+  row INTEGER NOT NULL
+);
+CREATE INDEX ids_path_curie ON ids (path, curie);
+-- Names with the IDs of their terms:
+-- rows of templates without an ID column get it from a template row with the same label
+CREATE VIEW terms AS
+SELECT n.name, n.kind, COALESCE(n.curie, l.curie) AS curie, n.label, n.path, n.row
+FROM names n
+LEFT JOIN names l
+  ON n.curie IS NULL
+ AND l.name = n.label
+ AND l.kind = 'label'
+ AND l.curie IS NOT NULL;
+"""
+
+
+def name_columns(strings):
+    """Return (column position, kind, separator) for the label and alternative term columns
+    of a template, using its template strings."""
+    columns = []
+    for i, string in enumerate(strings):
+        string = string.strip()
+        if string == "LABEL":
+            columns.append((i, "label", None))
+            continue
+        match = ANNOTATION_PATTERN.match(string)
+        if match and match.group(1) in ALTERNATIVE_TERMS:
+            columns.append((i, ALTERNATIVE_TERMS[match.group(1)], match.group(2)))
+    return columns
+
+
+def row_names(strings, rows, path, first=0):
+    """Yield a (name, kind, curie, label, path, row) tuple
+    for each label and alternative term in some data rows of a template,
+    starting at data row number `first`."""
+    columns = name_columns(strings)
+    id_column = strings.index("ID") if "ID" in strings else None
+    for i, row in enumerate(rows, first):
+        label = curie = None
+        for j, kind, _ in columns:
+            if kind == "label" and j < len(row) and row[j].strip():
+                label = row[j]
+        if id_column is not None and id_column < len(row) and row[id_column].strip():
+            curie = row[id_column]
+        for j, kind, separator in columns:
+            if j >= len(row):
+                continue
+            if kind == "label":
+                values = [row[j]]
+            elif separator:
+                values = [v.strip() for v in row[j].split(separator)]
+            else:
+                values = [row[j].strip()]
+            for value in values:
+                if value.strip():
+                    yield value, kind, curie, label, path, i + 3
+
+
+def row_ids(strings, rows, path, first=0):
+    """Yield a (curie, path, row) tuple for each data row of a template that has an ID,
+    starting at data row number `first`."""
+    if "ID" not in strings:
+        return
+    id_column = strings.index("ID")
+    for i, row in enumerate(rows, first):
+        if id_column < len(row) and row[id_column].strip():
+            yield row[id_column], path, i + 3
+
+
+class LabelIndex:
+    """Label, alternative term, ID, and template row lookups
+    backed by a SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.executescript(
+                "DROP VIEW IF EXISTS terms;"
+                "DROP TABLE IF EXISTS names;"
+                "DROP TABLE IF EXISTS ids;"
+                "DROP TABLE IF EXISTS files;"
+                + SCHEMA
+                + f"PRAGMA user_version = {SCHEMA_VERSION};"
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def known(self, path):
+        """Return (modification time, size, number of data rows) for an indexed template,
+        or None."""
+        return self.conn.execute(
+            "SELECT mtime_ns, size, rows FROM files WHERE path = ?", (path,)
+        ).fetchone()
+
+    def index(self, path):
+        """Index all of a template again, outside of any transaction of its own."""
+        stat = os.stat(path)
+        table = load_template(path)
+        self.conn.execute("DELETE FROM names WHERE path = ?", (path,))
+        self.conn.execute("DELETE FROM ids WHERE path = ?", (path,))
+        self.conn.executemany(
+            "INSERT INTO names VALUES (?, ?, ?, ?, ?, ?)",
+            row_names(table.strings, table, path),
+        )
+        self.conn.executemany(
+            "INSERT INTO ids VALUES (?, ?, ?)", row_ids(table.strings, table, path)
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+            (path, stat.st_mtime_ns, stat.st_size, len(table)),
+        )
+
+    def update(self, paths, forget=True):
+        """Index the templates at the given paths that have changed since the last update,
+        and unless `forget` is false, forget any other templates.
+        Return the list of paths that were indexed."""
+        updated = []
+        with self.conn:
+            known = {
+                path: (mtime_ns, size)
+                for path, mtime_ns, size in self.conn.execute(
+                    "SELECT path, mtime_ns, size FROM files"
+                )
+            }
+            if forget:
+                for path in set(known) - set(paths):
+                    self.conn.execute("DELETE FROM names WHERE path = ?", (path,))
+                    self.conn.execute("DELETE FROM ids WHERE path = ?", (path,))
+                    self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            for path in paths:
+                stat = os.stat(path)
+                if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                self.index(path)
+                updated.append(path)
+        return updated
+
+    def append(self, path, before, rows):
+        """Index data rows that were just appended to a template,
+        given the os.stat() of the template from before they were appended.
+        If the index was not up to date with the template before then,
+        index all of the template again instead."""
+        with self.conn:
+            known = self.known(path)
+            if not known or known[:2] != (before.st_mtime_ns, before.st_size):
+                self.index(path)
+                return
+            _, strings = read_headers(path)
+            self.conn.executemany(
+                "INSERT INTO names VALUES (?, ?, ?, ?, ?, ?)",
+                row_names(strings, rows, path, known[2]),
+            )
+            self.conn.executemany(
+                "INSERT INTO ids VALUES (?, ?, ?)", row_ids(strings, rows, path, known[2])
+            )
+            stat = os.stat(path)
+            self.conn.execute(
+                "UPDATE files SET mtime_ns = ?, size = ?, rows = ? WHERE path = ?",
+                (stat.st_mtime_ns, stat.st_size, known[2] + len(rows), path),
+            )
+
+    def find(self, name):
+        """Return (name, kind, ID, label, path, row) tuples
+        for a label, an alternative term, or an ID, in template order."""
+        return self.conn.execute(
+            """SELECT * FROM terms WHERE name = ?
+               UNION
+               SELECT * FROM terms
+               WHERE label IN (SELECT name FROM names WHERE curie = ? AND kind = 'label')
+               ORDER BY path, row, kind, name""",
+            (name, name),
+        ).fetchall()
+
+    def has_curie(self, curie, path):
+        """Return True if a row with this ID is in the template at `path`, labelled or not."""
+        return bool(
+            self.conn.execute(
+                "SELECT 1 FROM ids WHERE curie = ? AND path = ? LIMIT 1", (curie, path)
+            ).fetchone()
+        )
+
+    def last_number(self, prefix, digits, path):
+        """Return the highest number of the IDs in the template at `path`
+        with this prefix and number of digits, e.g. "ONTIE:" and 7, or 0 if there are none."""
+        first = prefix + "0" * digits
+        last = prefix + "9" * digits
+        for curie, in self.conn.execute(
+            """SELECT curie FROM ids
+               WHERE curie BETWEEN ? AND ? AND length(curie) = ? AND path = ?
+               ORDER BY curie DESC""",
+            (first, last, len(first), path),
+        ):
+            number = curie[len(prefix) :]
+            if number.isdigit():
+                return int(number)
+        return 0
+
+    def labels(self, curie, path):
+        """Return the labels of the term with this ID in the template at `path`."""
+        return [
+            label
+            for label, in self.conn.execute(
+                """SELECT DISTINCT name FROM names
+                   WHERE curie = ? AND kind = 'label' AND path = ?""",
+                (curie, path),
+            )
+        ]
+
+
+def main():
+    p = ArgumentParser(
+        description="Update an index of the labels and alternative terms in templates, "
+        "and look up labels, alternative terms, and IDs in it"
+    )
+    p.add_argument("database", help="Path to the SQLite index file")
+    p.add_argument("templates", nargs="*", help="Paths to the templates to index")
+    p.add_argument(
+        "-l",
+        "--lookup",
+        action="append",
+        default=[],
+        help="Print the template rows for a label, alternative term, or ID as TSV",
+    )
+    args = p.parse_args()
+
+    index = LabelIndex(args.database)
+    try:
+        if args.templates:
+            for path in index.update(args.templates):
+                print(f"Indexed {path}", file=sys.stderr)
+        if args.lookup:
+            print("name\tkind\tID\tlabel\ttemplate\trow")
+        for name in args.lookup:
+            for row in index.find(name):
+                print("\t".join("" if v is None else str(v) for v in row))
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
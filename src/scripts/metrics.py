@@ -0,0 +1,173 @@
+# Request timing, latency histograms, and counters for serve.py,
+# rendered in the Prometheus text exposition format.
+
+import bisect
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+DESCRIPTIONS = {
+    'serve_requests_total': ('counter', 'Requests handled, by route, method, and status'),
+    'serve_request_duration_seconds': (
+        'histogram',
+        'Time from routing a request until its response body has been sent',
+    ),
+    'serve_span_duration_seconds': ('histogram', 'Time spent in each stage of handling a request'),
+    'serve_nanobot_process_seconds': (
+        'histogram',
+        'Wall-clock time of Nanobot CGI processes, from spawn until exit',
+    ),
+    'serve_nanobot_cpu_seconds': (
+        'histogram',
+        'User and system CPU time of Nanobot CGI processes',
+    ),
+    'serve_slow_requests_total': ('counter', 'Requests slower than the slow request threshold'),
+}
+
+
+class Histogram:
+    """Counts of observations in fixed buckets, with their sum."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def copy(self):
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.sum = self.sum
+        return histogram
+
+    def lines(self, name, labels):
+        """Yield the exposition lines for this histogram,
+        with cumulative bucket counts."""
+        total = 0
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            total += count
+            yield f'{name}_bucket{format_labels(labels + [("le", str(bound))])} {total}'
+        yield f'{name}_sum{format_labels(labels)} {self.sum:.6f}'
+        yield f'{name}_count{format_labels(labels)} {total}'
+
+
+class RequestTimer:
+    """The timing of one request and the spans within it."""
+
+    def __init__(self, method, route, path):
+        self.method = method
+        self.route = route
+        self.path = path
+        self.start = time.perf_counter()
+        self.spans = []
+
+
+class Metrics:
+    """A thread-safe registry of counters and histograms.
+    The request being handled by each thread is tracked
+    so that spans can be attributed to it."""
+
+    def __init__(self, slow_request=None):
+        self.slow_request = slow_request
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def increment(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        key = (name, tuple(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if not histogram:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def start_request(self, method, route, path):
+        """Start timing a request in this thread and return its timer."""
+        timer = RequestTimer(method, route, path)
+        self.local.timer = timer
+        return timer
+
+    def finish_request(self, timer, status):
+        """Record the duration of a request,
+        logging it with its spans if it was slow.
+        Return the duration in seconds."""
+        elapsed = time.perf_counter() - timer.start
+        if getattr(self.local, 'timer', None) is timer:
+            self.local.timer = None
+        labels = [('route', timer.route), ('method', timer.method)]
+        self.increment('serve_requests_total', labels + [('status', str(status))])
+        self.observe('serve_request_duration_seconds', elapsed, labels)
+        if self.slow_request is not None and elapsed >= self.slow_request:
+            self.increment('serve_slow_requests_total', labels)
+            spans = ' '.join(f'{name}={seconds * 1000:.1f}ms' for name, seconds in timer.spans)
+            logging.warning(
+                f'Slow request: {elapsed * 1000:.1f}ms {timer.method} {timer.path} {status} {spans}'
+            )
+        return elapsed
+
+    def record_span(self, name, seconds):
+        """Record a span for the request being handled by this thread."""
+        self.observe('serve_span_duration_seconds', seconds, [('span', name)])
+        timer = getattr(self.local, 'timer', None)
+        if timer:
+            timer.spans.append((name, seconds))
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block as a span of the current request."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(name, time.perf_counter() - start)
+
+    def render(self):
+        """Return all metrics in the Prometheus text format."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = [(k, self.histograms[k].copy()) for k in sorted(self.histograms)]
+        lines = []
+        described = set()
+        for (name, labels), value in counters:
+            describe(lines, described, name)
+            lines.append(f'{name}{format_labels(list(labels))} {value}')
+        for (name, labels), histogram in histograms:
+            describe(lines, described, name)
+            lines.extend(histogram.lines(name, list(labels)))
+        return '\n'.join(lines) + '\n'
+
+
+def describe(lines, described, name):
+    """Add HELP and TYPE lines for a metric the first time it appears."""
+    if name in described:
+        return
+    described.add(name)
+    kind, text = DESCRIPTIONS.get(name, ('untyped', name))
+    lines.append(f'# HELP {name} {text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def format_labels(labels):
+    """Format a list of (name, value) pairs as a Prometheus label set."""
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
@@ -1,35 +1,42 @@
+import gzip
 import sqlite3
 
 from argparse import ArgumentParser
 
-# Track terms already added to database
-added = []
+# Number of statements to read from the extract table at a time when writing Turtle
+CHUNK_ROWS = 1000
 
 
-def add_term(cur, term_id):
-    """Add the class assertion for a term ID, assuming that term ID exists in the database."""
-    cur.execute(f"SELECT * FROM statements WHERE subject = '{term_id}';")
-    res = cur.fetchone()
-    if res:
-        cur.execute(
-            f"""INSERT INTO extract (stanza, subject, predicate, object)
-                        VALUES ('{term_id}', '{term_id}', 'rdf:type', 'owl:Class');"""
-        )
+def add_terms(cur, terms):
+    """Add the class assertions for the term IDs that exist in the database."""
+    cur.executemany(
+        """INSERT INTO extract (stanza, subject, predicate, object)
+          SELECT ?1, ?1, 'rdf:type', 'owl:Class'
+          WHERE EXISTS (SELECT 1 FROM statements WHERE subject = ?1);""",
+        [(t,) for t in terms],
+    )
+
+
+def add_seeds(cur, terms):
+    """Load the term IDs to extract into a temporary seeds table."""
+    cur.execute("DROP TABLE IF EXISTS temp.seeds;")
+    cur.execute("CREATE TEMP TABLE seeds(term TEXT PRIMARY KEY);")
+    cur.executemany("INSERT OR IGNORE INTO seeds VALUES (?);", [(t,) for t in terms if t])
 
 
-def add_ancestors(cur, term_id):
-    """Add the hierarchy for a term ID starting with that term up to the top-level, assuming that
-    term ID exists in the database."""
-    global added
+def add_hierarchy(cur):
+    """Add the hierarchy for all the seed terms, starting with each term and its direct children
+    up to the top-level, with one recursive query and one bulk insert for each kind of statement.
+    Each seed term is added, whether or not it exists in the database."""
+    cur.execute("DROP TABLE IF EXISTS temp.ancestors;")
     cur.execute(
-        f"""
+        """CREATE TEMP TABLE ancestors AS
           WITH RECURSIVE ancestors(parent, child) AS (
-            VALUES ('{term_id}', NULL)
+            SELECT term AS parent, NULL AS child FROM seeds
             UNION
             SELECT object AS parent, subject AS child
-            FROM statements
+            FROM statements JOIN seeds ON statements.object = seeds.term
             WHERE predicate = 'rdfs:subClassOf'
-              AND object = '{term_id}'
             UNION
             SELECT object AS parent, subject AS child
             FROM statements, ancestors
@@ -39,44 +46,111 @@ def add_ancestors(cur, term_id):
           )
           SELECT * FROM ancestors;"""
     )
+    cur.execute(
+        """INSERT INTO extract (stanza, subject, predicate, object)
+          SELECT term, term, 'rdf:type', 'owl:Class'
+          FROM (
+            SELECT parent AS term FROM ancestors WHERE parent IS NOT NULL
+            UNION
+            SELECT child AS term FROM ancestors WHERE child IS NOT NULL
+          );"""
+    )
+    cur.execute(
+        """INSERT INTO extract (stanza, subject, predicate, object)
+          SELECT DISTINCT child, child, 'rdfs:subClassOf', parent
+          FROM ancestors
+          WHERE child IS NOT NULL AND parent IS NOT NULL;"""
+    )
+
+
+def add_predicates(cur, annotations, table=None):
+    """Load the annotation property CURIEs to include into a temporary predicates table,
+    along with the ones in the predicate column of an existing table, if given."""
+    cur.execute("DROP TABLE IF EXISTS temp.predicates;")
+    cur.execute("CREATE TEMP TABLE predicates(predicate TEXT PRIMARY KEY);")
+    cur.executemany("INSERT OR IGNORE INTO predicates VALUES (?);", [(a,) for a in annotations])
+    if table:
+        quoted = '"' + table.replace('"', '""') + '"'
+        cur.execute(f"INSERT OR IGNORE INTO predicates SELECT DISTINCT predicate FROM {quoted};")
+
+
+def add_annotations(cur, filtered=False):
+    """Copy the annotations of every subject in the extract table with one bulk insert,
+    only for the predicates in the predicates table if filtered."""
+    query = """INSERT INTO extract (stanza, subject, predicate, value, language, datatype)
+              SELECT DISTINCT
+                s.subject AS stanza,
+                s.subject,
+                s.predicate,
+                s.value,
+                s.language,
+                s.datatype
+              FROM (SELECT DISTINCT subject FROM extract) AS e
+              JOIN statements AS s ON s.subject = e.subject"""
+    if filtered:
+        query += " JOIN predicates AS p ON p.predicate = s.predicate"
+    query += " WHERE s.value NOT NULL;"
+    cur.execute(query)
+
+
+def escape(value):
+    """Escape a string for a double-quoted Turtle literal."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def ttl_object(obj, value, datatype, language):
+    """Return the Turtle object of a statement, or None if it has no object or value."""
+    if obj is not None:
+        return obj
+    if value is None:
+        return None
+    literal = '"' + escape(value) + '"'
+    if datatype is not None:
+        return f"{literal}^^{datatype}"
+    if language is not None:
+        return f"{literal}@{language}"
+    return literal
+
 
-    for row in cur.fetchall():
-        parent = row["parent"]
-        if parent and parent not in added:
-            # Only add rdf:type if it hasn't been added
-            added.append(parent)
-            cur.execute(
-                f"""INSERT INTO extract (stanza, subject, predicate, object)
-                            VALUES ('{parent}', '{parent}', 'rdf:type', 'owl:Class');"""
-            )
-
-        child = row["child"]
-        if child and child not in added:
-            # Only add rdf:type if it hasn't been added
-            added.append(child)
-            cur.execute(
-                f"""INSERT INTO extract (stanza, subject, predicate, object)
-                            VALUES ('{child}', '{child}', 'rdf:type', 'owl:Class');"""
-            )
-
-        if child and parent:
-            # Row has child & parent, add subclass statement
-            cur.execute(
-                f"""INSERT INTO extract (stanza, subject, predicate, object)
-                            VALUES ('{child}', '{child}', 'rdfs:subClassOf', '{parent}');"""
-            )
-
-
-def dict_factory(cursor, row):
-    """Create a dict factory for sqlite cursor"""
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        d[col[0]] = row[idx]
-    return d
+def write_turtle(cur, output):
+    """Write the prefixes and the statements in the extract table as Turtle,
+    with the statements about each subject grouped with ';'.
+    Statements are read from the cursor CHUNK_ROWS at a time,
+    so memory use does not grow with the size of the extract."""
+    cur.execute("SELECT prefix, base FROM prefix;")
+    for prefix, base in cur.fetchall():
+        output.write(f"@prefix {prefix}: <{base}> .\n")
+
+    # rdf:type comes first for each subject
+    cur.execute(
+        """SELECT DISTINCT subject, predicate, object, value, datatype, language
+          FROM extract
+          ORDER BY subject, predicate <> 'rdf:type', predicate, object, value, datatype, language;"""
+    )
+    subject = None
+    seen = set()
+    while True:
+        rows = cur.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        for s, p, o, value, datatype, language in rows:
+            o = ttl_object(o, value, datatype, language)
+            if o is None:
+                continue
+            if s != subject:
+                if subject is not None:
+                    output.write(" .\n")
+                output.write(f"{s} {p} {o}")
+                subject = s
+                seen = {(p, o)}
+            elif (p, o) not in seen:
+                output.write(f" ;\n    {p} {o}")
+                seen.add((p, o))
+    if subject is not None:
+        output.write(" .\n")
 
 
 def main():
-    global added
     p = ArgumentParser()
     p.add_argument("-d", "--database", required=True, help="SQLite database")
     p.add_argument(
@@ -96,19 +170,40 @@ def main():
         "--annotations",
         help="File containing CURIEs of annotation properties to include",
     )
+    p.add_argument(
+        "-T",
+        "--annotation-table",
+        help="Table in the database with the CURIEs of annotation properties to include "
+        "in its predicate column",
+    )
     p.add_argument(
         "-n",
         "--no_hierarchy",
         action="store_true",
         help="If provided, do not create any rdfs:subClassOf statements",
     )
-    p.add_argument("-o", "--output", required=True, help="TTL output")
+    p.add_argument(
+        "-r",
+        "--read-only",
+        action="store_true",
+        help="Open the database read-only and build the extract table in a temporary database, "
+        "so that several extractions can run against the same database at once",
+    )
+    p.add_argument(
+        "--temp-store",
+        choices=["file", "memory"],
+        default="file",
+        help="With --read-only, keep the temporary database in a file (the default) or in memory",
+    )
+    p.add_argument(
+        "-o", "--output", required=True, help="TTL output, compressed with gzip if it ends in .gz"
+    )
     args = p.parse_args()
 
-    # Get required terms
+    # Get required terms, once each, in order
     with open(args.terms, "r") as f:
         terms = f.readlines()
-    terms = [x.strip() for x in terms]
+    terms = list(dict.fromkeys(x.strip() for x in terms))
 
     # Get optional annotations (otherwise, all annotations are included)
     annotations = None
@@ -119,19 +214,33 @@ def main():
         with open(args.annotations, "r") as f:
             annotations = f.readlines()
     if annotations:
-        annotations = ["'" + x.strip().replace("'", "''") + "'" for x in annotations]
-        annotations = ", ".join(annotations)
+        annotations = sorted({x.strip() for x in annotations})
+    filtered = bool(annotations or args.annotation_table)
 
     # Create a new table (extract) and copy the triples we care about
     # Then write the triples from that table to the output file
-    with sqlite3.connect(args.database) as conn:
-        conn.row_factory = dict_factory
+    # All statements are parameterized, so SQLite prepares each one once,
+    # and the extract table is built in one transaction
+    if args.read_only:
+        database = f"file:{args.database}?mode=ro"
+    else:
+        database = args.database
+    with sqlite3.connect(database, uri=args.read_only, isolation_level=None) as conn:
         cur = conn.cursor()
 
-        # Create the extract table
-        cur.execute("DROP TABLE IF EXISTS extract;")
+        # Create the extract table:
+        # a temporary one is only visible to this connection,
+        # and takes precedence over any extract table left in the database
+        if args.read_only:
+            cur.execute(f"PRAGMA temp_store = {args.temp_store.upper()};")
+        cur.execute("BEGIN;")
+        if args.read_only:
+            table = "TEMP TABLE"
+        else:
+            cur.execute("DROP TABLE IF EXISTS extract;")
+            table = "TABLE"
         cur.execute(
-            """CREATE TABLE extract(stanza TEXT,
+            f"""CREATE {table} extract(stanza TEXT,
                               subject TEXT,
                               predicate TEXT,
                               object TEXT,
@@ -140,75 +249,27 @@ def main():
                               language TEXT);"""
         )
 
-        # Get each term up to the top-level (unless no_hierarchy)
+        # Get all the terms up to the top-level at once (unless no_hierarchy)
         if not args.no_hierarchy:
-            for t in terms:
-                add_ancestors(cur, t)
+            add_seeds(cur, terms)
+            add_hierarchy(cur)
         else:
             # Only add the terms themselves (as long as they exist)
-            for t in terms:
-                add_term(cur, t)
-
-        # Add annotations for all subjects
-        cur.execute("SELECT DISTINCT subject FROM extract;")
-        for row in cur.fetchall():
-            subject = row["subject"]
-            query = f"""INSERT INTO extract (stanza, subject, predicate, value, language, datatype)
-                        SELECT DISTINCT
-                          subject AS stanza,
-                          subject,
-                          predicate,
-                          value,
-                          language,
-                          datatype
-                        FROM statements WHERE subject = '{subject}' AND value NOT NULL"""
-            if annotations:
-                query += f" AND predicate IN ({annotations})"
-            cur.execute(query)
-
-        # Reset row factory
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
+            add_terms(cur, terms)
 
-        # Get ttl lines
-        cur.execute(
-            '''WITH literal(value, escaped) AS (
-                      SELECT DISTINCT
-                        value,
-                        replace(replace(replace(value, '\\', '\\\\'), '"', '\\"'), '
-                    ', '\\n') AS escaped
-                      FROM extract
-                    )
-                    SELECT
-                      "@prefix " || prefix || ": <" || base || "> ."
-                    FROM prefix
-                    UNION ALL
-                    SELECT DISTINCT
-                       subject
-                    || " "
-                    || predicate
-                    || " "
-                    || coalesce(
-                         object,
-                         """" || escaped || """^^" || datatype,
-                         """" || escaped || """@" || language,
-                         """" || escaped || """"
-                       )
-                    || " ."
-                    FROM extract LEFT JOIN literal ON extract.value = literal.value;'''
-        )
-        lines = []
-        for row in cur.fetchall():
-            line = row[0]
-            if not line:
-                continue
-            # Replace newlines
-            line = line.replace("\n", "\\n")
-            lines.append(line + "\n")
+        # Add annotations for all subjects at once
+        if filtered:
+            add_predicates(cur, annotations or [], args.annotation_table)
+        add_annotations(cur, filtered)
+        cur.execute("COMMIT;")
 
         # Write ttl
-        with open(args.output, "w") as f:
-            f.writelines(lines)
+        if args.output.endswith(".gz"):
+            output = gzip.open(args.output, "wt")
+        else:
+            output = open(args.output, "w")
+        with output:
+            write_turtle(cur, output)
 
 
 if __name__ == "__main__":
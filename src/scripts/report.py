@@ -1,14 +1,54 @@
 import csv
+import functools
+import gc
+import hashlib
+import json
+import os
 import re
+import sqlite3
 import sys
+import time
+import zlib
 
 import logging
 
 from argparse import ArgumentParser
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from itertools import combinations, combinations_with_replacement
+import templates
 
+from templates import load_template
 
-def idx_to_a1(row, col):
-    """Convert a row & column to A1 notation. Adapted from gspread.utils."""
+
+# Bump to discard state files written by older versions of the checks
+STATE_VERSION = 1
+
+FIELDS = ["table", "cell", "level", "rule ID", "rule", "message", "suggestion"]
+
+# Number of problems in each Parquet row group or Arrow record batch
+BATCH_SIZE = 10000
+
+# Minimum similarity of misspelled words (see difflib.SequenceMatcher.ratio)
+MIN_SIMILARITY = 0.8
+# Shorter words, and words with digits, are codes that differ by design, like "CBA" and "DBA"
+MIN_WORD_LENGTH = 5
+# Maximum number of misspelled words in near-duplicates
+MAX_MISSPELLED = 2
+# Near-duplicates are compared only within their block (see near_block),
+# and in blocks of at least MIN_KEYED_TEXTS texts only if they share a key (see deletion_keys)
+MIN_KEYED_TEXTS = 20
+
+WORD = re.compile(r"[^\W_]+")
+# A trailing qualifier such as an organism: "10 kDa chaperonin (Mycobacterium leprae)"
+QUALIFIER = re.compile(r"\s+\([^()]*\)$")
+
+
+@functools.lru_cache(maxsize=None)
+def column_label(col):
+    """Convert a column number to its A1 letters. Adapted from gspread.utils."""
     div = col
     column_label = ""
 
@@ -19,366 +59,1265 @@ def idx_to_a1(row, col):
             div -= 1
         column_label = chr(mod + 64) + column_label
 
-    label = f"{column_label}{row}"
+    return column_label
+
+
+def idx_to_a1(row, col):
+    """Convert a row & column to A1 notation."""
+    return f"{column_label(col)}{row}"
+
+
+def read_table(path):
+    """Read a template, returning its headers and its data rows (see templates.Template).
+    The first data row is row 3; 1=headers, 2=template."""
+    table = load_template(path)
+    return table.headers, table
+
+
+class Columns:
+    """The column positions of a table, looked up once from its headers
+    instead of for every row."""
+
+    def __init__(self, headers):
+        self.headers = headers
+        # Header -> 0-based index of its first column
+        self.index = {}
+        for i, h in enumerate(headers):
+            self.index.setdefault(h, i)
+        # Columns for generic checks stop at the first column without a header
+        self.generic = []
+        for i, h in enumerate(headers):
+            if not h:
+                break
+            self.generic.append(i)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def col(self, name):
+        """Return the 1-based column number for a header."""
+        return self.index[name] + 1
+
+    def value(self, row, name):
+        """Return the value of a row in the named column, or None if the row is short."""
+        i = self.index[name]
+        return row[i] if i < len(row) else None
+
+
+def row_key(row, *extra):
+    """Return a hash of the values of a row and any extra values it was checked against.
+    Rows with the same key always give the same check results."""
+    text = "\x1e".join(extra) + "\x1d" + "\x1f".join(row)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class Rule:
+    """A self-contained QC check and the columns that it reads.
+    Row rules check one data row and return a list of [column, problem] pairs, or None.
+    Aggregate rules check all the entries for one key of a shared map
+    (see index_entries and template_entries)
+    and return a list of [row, column, problem] lists.
+    Rules that are not run by `default` must be enabled by name."""
+
+    def __init__(self, name, table, columns, check, map=None, default=True):
+        self.name = name
+        self.id = f"ROBOT:report_queries/{name}"
+        self.table = table
+        self.columns = columns
+        self.check = check
+        self.map = map
+        self.default = default
+
+    def applies(self, columns):
+        """Return True if a table has all the columns that this rule reads."""
+        return all(c in columns for c in self.columns)
+
+
+# Registered rules, in the order that their problems are reported
+RULES = []
+
+
+def row_rule(table, name, columns, default=True):
+    """Register a row rule for the "index" or for "template" tables."""
+
+    def register(check):
+        RULES.append(Rule(name, table, columns, check, default=default))
+        return check
+
+    return register
+
+
+def aggregate_rule(table, name, map, columns, default=True):
+    """Register an aggregate rule over a shared map,
+    run for each key with more than one entry."""
+
+    def register(check):
+        RULES.append(Rule(name, table, columns, check, map=map, default=default))
+        return check
+
+    return register
+
+
+def table_rules(table, columns, enabled=()):
+    """Return the row rules and the aggregate rules
+    for a kind of table that apply to its columns,
+    including the `enabled` rules that are off by default."""
+    rules = [
+        r
+        for r in RULES
+        if r.table == table and r.applies(columns) and (r.default or r.name in enabled)
+    ]
+    return [r for r in rules if not r.map], [r for r in rules if r.map]
+
+
+class RuleStats:
+    """Execution time and hit counts for each rule,
+    and for building the shared map entries that aggregate rules read."""
+
+    def __init__(self):
+        # Rule ID -> [calls, hits, seconds]
+        self.stats = {}
+
+    def record(self, rule_id, calls, hits, seconds):
+        stats = self.stats.setdefault(rule_id, [0, 0, 0.0])
+        stats[0] += calls
+        stats[1] += hits
+        stats[2] += seconds
+
+    def run(self, rule, *args):
+        """Run a rule's check once and return its problems as a list."""
+        start = time.perf_counter()
+        problems = rule.check(*args) or []
+        self.record(rule.id, 1, len(problems), time.perf_counter() - start)
+        return problems
+
+    def run_rows(self, rule, columns, rows):
+        """Run a row rule over a list of rows
+        and return a list of problems for each row.
+        The rule is timed once for all the rows."""
+        check = rule.check
+        start = time.perf_counter()
+        problems = [check(columns, row) or () for row in rows]
+        elapsed = time.perf_counter() - start
+        self.record(rule.id, len(rows), sum(len(p) for p in problems), elapsed)
+        return problems
+
+    def run_entries(self, function, args):
+        """Call a function that returns the shared map entries for a row
+        (see index_entries and template_entries) with each tuple of arguments,
+        and return a list of entries for each row.
+        Its time is recorded under the function's name, with the number of entries as hits."""
+        start = time.perf_counter()
+        entries = [function(*a) for a in args]
+        elapsed = time.perf_counter() - start
+        self.record(function.__name__, len(entries), sum(len(e) for e in entries), elapsed)
+        return entries
+
+    def merge(self, other):
+        """Add the stats from another run, such as a worker process."""
+        for rule, (calls, hits, seconds) in other.stats.items():
+            stats = self.stats.setdefault(rule, [0, 0, 0.0])
+            stats[0] += calls
+            stats[1] += hits
+            stats[2] += seconds
+
+    def write(self, output):
+        """Write a TSV table of rules, slowest first."""
+        output.write("rule ID\tcalls\thits\tseconds\n")
+        for rule, (calls, hits, seconds) in sorted(
+            self.stats.items(), key=lambda x: x[1][2], reverse=True
+        ):
+            output.write(f"{rule}\t{calls}\t{hits}\t{seconds:.3f}\n")
+
+
+def check_rows(stats, rules, columns, rows):
+    """Run each row rule over a list of rows,
+    returning a list of problems for each row, in rule order."""
+    problems = [[] for _ in rows]
+    for rule in rules:
+        for found, hits in zip(problems, stats.run_rows(rule, columns, rows)):
+            found.extend(hits)
+    return problems
+
+
+def index_label(columns, row):
+    """Return the label of an index row, or None if it is missing."""
+    label = columns.value(row, "Label")
+    if not label or label.strip() == "":
+        return None
     return label
 
 
+# Index rules
+
+@row_rule("index", "missing_label", ["Label"])
+def missing_label(columns, row):
+    if not index_label(columns, row):
+        return [
+            [
+                columns.col("Label"),
+                {
+                    "level": "error",
+                    "rule ID": "ROBOT:report_queries/missing_label",
+                    "rule": "missing label",
+                    "message": "add a label",
+                },
+            ]
+        ]
+
+
+@row_rule("index", "label_whitespace", ["Label"])
+def label_whitespace(columns, row):
+    label = index_label(columns, row)
+    if label and label.strip() != label:
+        return [
+            [
+                columns.col("Label"),
+                {
+                    "level": "error",
+                    "rule ID": "ROBOT:report_queries/label_whitespace",
+                    "rule": "label whitespace",
+                    "suggestion": label.strip(),
+                    "message": "remove leading and trailing whitespace from label",
+                },
+            ]
+        ]
+
+
+@row_rule("index", "label_formatting", ["Label"])
+def label_formatting(columns, row):
+    label = index_label(columns, row)
+    if label and ("\n" in label or "\t" in label):
+        return [
+            [
+                columns.col("Label"),
+                {
+                    "level": "error",
+                    "rule ID": "ROBOT:report_queries/label_formatting",
+                    "rule": "label formatting",
+                    "suggestion": label.replace("\n", " ").replace("\t", " "),
+                    "message": "remove new lines and tabs from label",
+                },
+            ]
+        ]
+
+
+def is_obsolete(columns, row):
+    return (columns.value(row, "obsolete") or "").lower() == "true"
+
+
+@row_rule("index", "missing_obsolete_label", ["Label", "obsolete"])
+def missing_obsolete_label(columns, row):
+    label = index_label(columns, row)
+    if label and is_obsolete(columns, row) and not label.lower().startswith("obsolete"):
+        return [
+            [
+                columns.col("Label"),
+                {
+                    "level": "warn",
+                    "rule ID": "ROBOT:report_queries/missing_obsolete_label",
+                    "rule": "missing obsolete label",
+                    "suggestion": f"obsolete {label}",
+                    "message": "add obsolete to beginning of label",
+                },
+            ]
+        ]
+
+
+@row_rule("index", "misused_obsolete_label", ["Label", "obsolete"])
+def misused_obsolete_label(columns, row):
+    label = index_label(columns, row)
+    # not obsolete = true, but label begins with 'obsolete'
+    if label and not is_obsolete(columns, row) and label.startswith("obsolete"):
+        return [
+            [
+                columns.col("Label"),
+                {
+                    "level": "error",
+                    "rule ID": "ROBOT:report_queries/misused_obsolete_label",
+                    "rule": "misused obsolete label",
+                    "suggestion": label.split(" ", 1)[1],
+                    "message": "remove obsolete from label or mark term as obsolete",
+                },
+            ]
+        ]
+
+
+def index_entries(columns, row):
+    """Return the (map, key, column, value) entries that an index row adds to the shared maps."""
+    label = index_label(columns, row)
+    if not label:
+        return []
+    col = columns.col("Label")
+    curie = columns.value(row, "ID")
+    entries = [
+        # ID -> Label to check for multiple labels
+        ["labels", curie, col, label],
+        # Label -> ID to check for duplicate labels
+        ["curies", label, col, curie],
+    ]
+    if "obsolete" in columns and is_obsolete(columns, row):
+        entries.append(["obsolete", curie, col, True])
+        return entries
+    # Keys for near-duplicates of the labels of terms that are not obsolete
+    stem = QUALIFIER.sub("", label) if label.endswith(")") else label
+    norm = normalize(stem)
+    stem_key = norm.replace(" ", "")
+    qualifier = compact(label[len(stem) :]) if len(stem) < len(label) else ""
+    # compact(label), since compact only drops characters
+    entries.append(["label_norms", stem_key + qualifier, col, label])
+    entries.append(["label_stems", stem_key, col, label])
+    # Labels with the same qualifier are compared without it
+    entries.append(["label_blocks", near_block(norm, qualifier), col, label])
+    return entries
+
+
+def other_locs(entries, entry):
+    """Return the comma-separated locations of the other entries."""
+    locs = [idx_to_a1(row, col) for row, col, _, _ in entries]
+    loc = idx_to_a1(entry[0], entry[1])
+    return ", ".join([x for x in locs if x != loc])
+
+
+@functools.lru_cache(maxsize=None)
+def normalize(text):
+    """Lowercase text and replace punctuation and runs of whitespace with single spaces."""
+    return " ".join(WORD.findall(text.casefold()))
+
+
+def compact(text):
+    """Return a key for text that ignores case, whitespace, and punctuation."""
+    return normalize(text).replace(" ", "")
+
+
+def near_block(norm, context=""):
+    """Return the block of normalized text for near-duplicates, which have the same block:
+    the same number of words, the same short words and numbers, which cannot be misspelled,
+    and the same context, such as a qualifier."""
+    words = norm.split()
+    codes = sorted(w for w in words if len(w) < MIN_WORD_LENGTH or not w.isalpha())
+    return f"{context}\x1f{len(words)}\x1f{' '.join(codes)}"
+
+
+@functools.lru_cache(maxsize=None)
+def misspelled(a, b):
+    """Return True if two words are similar enough to be misspellings of each other."""
+    if min(len(a), len(b)) < MIN_WORD_LENGTH or not (a.isalpha() and b.isalpha()):
+        return False
+    # Cheap upper bounds first, as in difflib.get_close_matches,
+    # starting with real_quick_ratio without building a matcher
+    if 2 * min(len(a), len(b)) < MIN_SIMILARITY * (len(a) + len(b)):
+        return False
+    matcher = SequenceMatcher(None, a, b)
+    return matcher.quick_ratio() >= MIN_SIMILARITY and matcher.ratio() >= MIN_SIMILARITY
+
+
+def similar_words(a, b):
+    """Return True if two lists of words are the same but for their order
+    and pairs of misspelled words, such as "chaperonin" and "chaperonine"."""
+    set_a = set(a)
+    set_b = set(b)
+    if len(set_a.symmetric_difference(set_b)) > 2 * MAX_MISSPELLED:
+        return False
+    if len(set_a) == len(a) and len(set_b) == len(b):
+        only_a = sorted(set_a - set_b)
+        only_b = sorted(set_b - set_a)
+    else:
+        only_a = sorted((Counter(a) - Counter(b)).elements())
+        only_b = sorted((Counter(b) - Counter(a)).elements())
+    if len(only_a) != len(only_b) or len(only_a) > MAX_MISSPELLED:
+        return False
+    for word in only_a:
+        for other in only_b:
+            if misspelled(word, other):
+                only_b.remove(other)
+                break
+        else:
+            return False
+    return True
+
+
+def deletion_keys(norm):
+    """Return the keys of normalized text for near-duplicates, which share at least one:
+    order-insensitive hashes of the words that can be misspelled,
+    each without a different MAX_MISSPELLED of them.
+    The texts in a block have the same number of these words, and the same other words,
+    so near-duplicates are the same once the words that differ, and maybe others, are removed."""
+    hashes = [
+        zlib.crc32(w.encode("utf-8"))
+        for w in norm.split()
+        if len(w) >= MIN_WORD_LENGTH and w.isalpha()
+    ]
+    if len(hashes) <= MAX_MISSPELLED:
+        return {0}
+    total = sum(hashes)
+    # Repeated words give repeated keys, and words may be removed more times than they occur
+    return {total - sum(c) for c in combinations_with_replacement(set(hashes), MAX_MISSPELLED)}
+
+
+def candidate_pairs(norms):
+    """Return the sorted pairs of positions in a list of normalized texts from one block
+    that share a key (see deletion_keys): the only pairs that can be near-duplicates.
+    Return None, for every pair, if there are too few texts for keys to pay off."""
+    if len(norms) < MIN_KEYED_TEXTS:
+        return None
+    keys = [deletion_keys(norm) for norm in norms]
+    # Most keys belong to one text: find the others with set operations first
+    seen = set()
+    shared = set()
+    for k in keys:
+        shared |= seen & k
+        seen |= k
+    buckets = {}
+    for i, k in enumerate(keys):
+        for key in k & shared:
+            buckets.setdefault(key, []).append(i)
+    return sorted({pair for bucket in buckets.values() for pair in combinations(bucket, 2)})
+
+
+def similar_texts(norms):
+    """Return a function of two positions in a list of normalized texts
+    that is True if the texts there are near-duplicates (see similar_words).
+    Texts that differ only in case, whitespace, or punctuation are left to other rules."""
+    keys = [n.replace(" ", "") for n in norms]
+    words = [n.split() for n in norms]
+    return lambda i, j: keys[i] != keys[j] and similar_words(words[i], words[j])
+
+
+def near_duplicates(entries, same, rule_id, rule, message, pairs=None):
+    """Return a warning for each entry that is the `same` as other entries,
+    where `same` is a function of two positions in the entries,
+    with a message formatted with the locations of the others.
+    Only the given pairs of positions are compared, or else every pair."""
+    others = [[] for _ in entries]
+    if pairs is None:
+        pairs = combinations(range(len(entries)), 2)
+    for i, j in pairs:
+        if same(i, j):
+            others[i].append(entries[j])
+            others[j].append(entries[i])
+    return [
+        [
+            e[0],
+            e[1],
+            {
+                "level": "warn",
+                "rule ID": rule_id,
+                "rule": rule,
+                "message": message.format(other_locs(o, e)),
+            },
+        ]
+        for e, o in zip(entries, others)
+        if o
+    ]
+
+
+@aggregate_rule("index", "multiple_labels", "labels", ["Label"])
+def multiple_labels(curie, entries):
+    return [
+        [
+            e[0],
+            e[1],
+            {
+                "level": "error",
+                "rule ID": "ROBOT:report_queries/multiple_labels",
+                "rule": "multiple labels",
+                "message": f"select one label from this & {other_locs(entries, e)}",
+            },
+        ]
+        for e in entries
+    ]
+
+
+@aggregate_rule("index", "duplicate_label", "curies", ["Label"])
+def duplicate_label(label, entries):
+    return [
+        [
+            e[0],
+            e[1],
+            {
+                "level": "error",
+                "rule ID": "ROBOT:report_queries/duplicate_label",
+                "rule": "duplicate label",
+                "suggestion": f"",
+                "message": f"assign unique labels to this * {other_locs(entries, e)}",
+            },
+        ]
+        for e in entries
+    ]
+
+
+@aggregate_rule("index", "near_duplicate_label", "label_norms", ["Label"])
+def near_duplicate_label(key, entries):
+    return near_duplicates(
+        entries,
+        lambda i, j: entries[i][2] != entries[j][2],
+        "ROBOT:report_queries/near_duplicate_label",
+        "near duplicate label",
+        "labels differ only in case, whitespace, or punctuation: merge or distinguish this & {}",
+    )
+
+
+# Off by default: most labels that differ only in their qualifier are meant to,
+# such as the same protein in different taxa, or strains of one species
+@aggregate_rule("index", "qualified_duplicate_label", "label_stems", ["Label"], default=False)
+def qualified_duplicate_label(key, entries):
+    keys = [compact(e[2]) for e in entries]
+    return near_duplicates(
+        entries,
+        lambda i, j: keys[i] != keys[j],
+        "ROBOT:report_queries/qualified_duplicate_label",
+        "qualified duplicate label",
+        "labels differ only in their qualifier: check that this & {} are different terms",
+    )
+
+
+@aggregate_rule("index", "similar_label", "label_blocks", ["Label"])
+def similar_label(block, entries):
+    norms = [normalize(QUALIFIER.sub("", e[2])) for e in entries]
+    return near_duplicates(
+        entries,
+        similar_texts(norms),
+        "ROBOT:report_queries/similar_label",
+        "similar label",
+        "labels differ only in word order or spelling: merge or distinguish this & {}",
+        pairs=candidate_pairs(norms),
+    )
+
+
+# Template rules, for rows of non-obsolete terms
+
+@row_rule("template", "annotation_whitespace", [])
+def annotation_whitespace(columns, row):
+    problems = []
+    for i in columns.generic:
+        value = row[i] if i < len(row) else None
+        # Check for whitespace
+        if value and value.strip() != "":
+            if value.strip() != value:
+                problems.append(
+                    [
+                        i + 1,
+                        {
+                            "level": "warn",
+                            "rule ID": "ROBOT:report_queries/annotation_whitespace",
+                            "rule": "annotation whitespace",
+                            "suggestion": value.strip(),
+                            "message": "remove leading and trailing whitespace",
+                        },
+                    ]
+                )
+    return problems
+
+
+@row_rule("template", "missing_superclass", ["Parent"])
+def missing_superclass(columns, row):
+    parent = columns.value(row, "Parent")
+    if not parent or parent.strip() == "":
+        # No superclass
+        return [
+            [
+                columns.col("Parent"),
+                {
+                    "level": "info",
+                    "rule ID": "ROBOT:report_queries/missing_superclass",
+                    "rule": "missing superclass",
+                    "message": "add a superclass or ignore this message",
+                },
+            ]
+        ]
+
+
+@row_rule("template", "missing_definition", ["Definition"])
+def missing_definition(columns, row):
+    definition = columns.value(row, "Definition")
+    if not definition or definition.strip() == "":
+        return [
+            [
+                columns.col("Definition"),
+                {
+                    "level": "warn",
+                    "rule ID": "ROBOT:report_queries/missing_definition",
+                    "rule": "missing definition",
+                    "message": "add a definition",
+                },
+            ]
+        ]
+
+
+@row_rule("template", "lowercase_definition", ["Definition"])
+def lowercase_definition(columns, row):
+    definition = columns.value(row, "Definition")
+    if definition and definition.strip() != "" and not re.match(r"^[A-Z]", definition.strip()):
+        return [
+            [
+                columns.col("Definition"),
+                {
+                    "level": "info",
+                    "rule ID": "ROBOT:report_queries/lowercase_definition",
+                    "rule": "lowercase definition",
+                    "suggestion": definition.capitalize(),
+                    "message": "capitalize the first letter of the definition",
+                },
+            ]
+        ]
+
+
+def template_entries(columns, row, curie):
+    """Return the (map, key, column, value) entries that a template row
+    for the given term adds to the shared maps."""
+    entries = []
+    if "Definition" in columns:
+        definition = columns.value(row, "Definition")
+        col = columns.col("Definition")
+        if definition and definition.strip() != "":
+            # ID -> definition for multiple definitions
+            entries.append(["definitions", curie, col, definition])
+            # definition -> loc for duplicate definitions
+            entries.append(["definition_locs", definition, col, None])
+            # Keys for near-duplicates of definitions
+            norm = normalize(definition)
+            entries.append(["definition_norms", norm.replace(" ", ""), col, definition])
+            entries.append(["definition_blocks", near_block(norm), col, definition])
+
+    if "Alternative Term" in columns:
+        col = columns.col("Alternative Term")
+        alt_terms = columns.value(row, "Alternative Term")
+        if alt_terms and alt_terms.strip() != "":
+            alt_terms = alt_terms.split("|")
+            for at in alt_terms:
+                if at.strip != "":
+                    # alt term -> loc for duplicate alt terms
+                    entries.append(["alt_terms", at.strip(), col, None])
+    return entries
+
+
+@aggregate_rule("template", "multiple_definitions", "definitions", ["Definition"])
+def multiple_definitions(curie, entries):
+    return [
+        [
+            e[0],
+            e[1],
+            {
+                "level": "error",
+                "rule ID": "ROBOT:report_queries/multiple_definitions",
+                "rule": "multiple definitions",
+                "message": f"select one definition from this & {other_locs(entries, e)}",
+            },
+        ]
+        for e in entries
+    ]
+
+
+@aggregate_rule("template", "duplicate_definition", "definition_locs", ["Definition"])
+def duplicate_definition(definition, entries):
+    return [
+        [
+            e[0],
+            e[1],
+            {
+                "level": "error",
+                "rule ID": "ROBOT:report_queries/duplicate_definition",
+                "rule": "duplicate definitions",
+                "message": f"write unique definitions for this & {other_locs(entries, e)}",
+            },
+        ]
+        for e in entries
+    ]
+
+
+@aggregate_rule("template", "duplicate_exact_synonym", "alt_terms", ["Alternative Term"])
+def duplicate_exact_synonym(alt_term, entries):
+    return [
+        [
+            e[0],
+            e[1],
+            {
+                "level": "warn",
+                "rule ID": "ROBOT:report_queries/duplicate_exact_synonym",
+                "rule": f"duplicate exact synonym '{alt_term}'",
+                "message": f"assign unique synonyms to this & {other_locs(entries, e)}",
+            },
+        ]
+        for e in entries
+    ]
+
+
+@aggregate_rule("template", "near_duplicate_definition", "definition_norms", ["Definition"])
+def near_duplicate_definition(key, entries):
+    return near_duplicates(
+        entries,
+        lambda i, j: entries[i][2] != entries[j][2],
+        "ROBOT:report_queries/near_duplicate_definition",
+        "near duplicate definition",
+        "definitions differ only in case, whitespace, or punctuation: "
+        "write unique definitions for this & {}",
+    )
+
+
+@aggregate_rule("template", "similar_definition", "definition_blocks", ["Definition"])
+def similar_definition(block, entries):
+    norms = [normalize(e[2]) for e in entries]
+    return near_duplicates(
+        entries,
+        similar_texts(norms),
+        "ROBOT:report_queries/similar_definition",
+        "similar definition",
+        "definitions differ only in word order or spelling: write unique definitions for this & {}",
+        pairs=candidate_pairs(norms),
+    )
+
+
+@contextmanager
+def gc_paused():
+    """Turn off the cyclic garbage collector in a `with` block, if it was on,
+    and then move everything that was built to its permanent generation.
+    The checks build hundreds of thousands of lists for the shared maps,
+    which form no reference cycles, so the collector would only scan them again and again.
+    Frozen objects are still freed when they are no longer referenced."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.freeze()
+            gc.enable()
+
+
+def update_table(state, keys, check, rules, stats):
+    """Bring the saved state of one table up to date with its current rows.
+
+    `keys` has a key for each data row (see row_key), or None for rows to skip.
+    Only rows with keys that are not in the saved state are checked, using `check(indices)`,
+    which returns the problems and the shared map entries for each of the data rows.
+    The shared maps are updated only at rows whose keys changed,
+    and the aggregate `rules` are re-run only for the map keys that those rows touch."""
+    old_keys = state.get("rows", [])
+    old_results = state.get("results", {})
+    maps = state.setdefault("maps", {})
+    aggregate = state.setdefault("aggregate", {})
+    for rule in rules:
+        maps.setdefault(rule.map, {})
+        aggregate.setdefault(rule.id, {})
+
+    # Check the first row with each new key
+    new_rows = {}
+    for i, key in enumerate(keys):
+        if key is not None and key not in old_results and key not in new_rows:
+            new_rows[key] = i
+    results = dict(zip(new_rows, check(list(new_rows.values()))))
+    for key in keys:
+        if key is not None and key not in results:
+            results[key] = old_results[key]
+
+    # Without saved rows every key is new, so keys need not be tracked one by one
+    fresh = not old_keys
+    touched = set()
+    for i in range(max(len(old_keys), len(keys))):
+        old = old_keys[i] if i < len(old_keys) else None
+        new = keys[i] if i < len(keys) else None
+        if old == new:
+            continue
+        row = i + 3
+        if old is not None:
+            for name, key, _, _ in old_results[old][1]:
+                entries = [e for e in maps[name][key] if e[0] != row]
+                if entries:
+                    maps[name][key] = entries
+                else:
+                    del maps[name][key]
+                touched.add((name, key))
+        if new is not None:
+            for seq, (name, key, col, value) in enumerate(results[new][1]):
+                entry = [row, col, value, seq]
+                entries = maps.setdefault(name, {}).get(key)
+                if entries is None:
+                    maps[name][key] = [entry]
+                    # A key with one entry has no aggregate problems,
+                    # but it may have had some before
+                    if not fresh:
+                        touched.add((name, key))
+                else:
+                    entries.append(entry)
+                    if not fresh:
+                        touched.add((name, key))
+
+    by_map = {}
+    for rule in rules:
+        by_map.setdefault(rule.map, []).append(rule)
+    if fresh:
+        touched = {
+            (name, key)
+            for name in by_map
+            for key, entries in maps[name].items()
+            if len(entries) > 1
+        }
+
+    # Aggregate rules look for keys with more than one entry
+    for name, key in touched:
+        if name not in by_map:
+            continue
+        entries = maps[name].get(key)
+        several = entries and len(entries) > 1
+        if several:
+            entries.sort(key=lambda e: (e[0], e[3]))
+        for rule in by_map[name]:
+            problems = several and stats.run(rule, key, entries)
+            if problems:
+                aggregate[rule.id][key] = problems
+            else:
+                aggregate[rule.id].pop(key, None)
+
+    state["rows"] = keys
+    state["results"] = results
+
+
+def table_problems(table, state, rules):
+    """Yield the problems for a table from its state:
+    row problems in row order, then aggregate problems for each rule
+    in the order of their first row."""
+    results = state["results"]
+    for i, key in enumerate(state["rows"]):
+        if key is None:
+            continue
+        for col, problem in results[key][0]:
+            yield {"table": table, "cell": idx_to_a1(i + 3, col), **problem}
+    maps = state["maps"]
+    for rule in rules:
+        found = state["aggregate"][rule.id]
+        entries = maps[rule.map]
+        # The first entry of each key gives its row and position in the row
+        for key in sorted(found, key=lambda k: (entries[k][0][0], entries[k][0][3])):
+            for row, col, problem in found[key]:
+                yield {"table": table, "cell": idx_to_a1(row, col), **problem}
+
+
+def file_stat(path):
+    """Return the modification time and size of a file, to detect changes."""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def code_version(enabled=()):
+    """Return the state version, a hash of this script and of templates.py, and the enabled rules,
+    so that saved state is discarded when the checks or the parsing change."""
+    digest = hashlib.sha1()
+    for path in [__file__, templates.__file__]:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return [STATE_VERSION, digest.hexdigest(), sorted(enabled)]
+
+
+def index_labels(index):
+    """Return the map of Label -> CURIE for non-duplicate labels
+    and the set of obsolete CURIEs from the state of the index."""
+    label_to_curie = {}
+    for label, entries in index["maps"].get("curies", {}).items():
+        if len(entries) == 1:
+            label_to_curie[label] = entries[0][2]
+    return label_to_curie, set(index["maps"].get("obsolete", {}))
+
+
+def labels_digest(label_to_curie, obsolete):
+    """Return a hash of the labels that templates are checked against."""
+    labels = json.dumps([sorted(label_to_curie.items()), sorted(obsolete)])
+    return hashlib.sha1(labels.encode("utf-8")).hexdigest()
+
+
+class StateStore:
+    """The saved state of each table, in a SQLite file.
+    The problems of each table are kept apart from the rest of its state,
+    so an unchanged table costs only reading its problems,
+    and only the tables that changed are written."""
+
+    def __init__(self, path, enabled=()):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS tables (
+                 path TEXT PRIMARY KEY,
+                 version TEXT NOT NULL,
+                 stat TEXT NOT NULL,
+                 state TEXT NOT NULL,
+                 problems TEXT NOT NULL
+               )"""
+        )
+        # State from other versions of the checks is ignored, and replaced when it is saved
+        self.version = json.dumps(code_version(enabled))
+        self.stats = {
+            path: json.loads(stat)
+            for path, stat in self.conn.execute(
+                "SELECT path, stat FROM tables WHERE version = ?", (self.version,)
+            )
+        }
+
+    def stat(self, path):
+        """Return the file_stat of a table when its state was saved, or None."""
+        return self.stats.get(path)
+
+    def load(self, path):
+        """Return the saved state of a table, or None."""
+        if path not in self.stats:
+            return None
+        row = self.conn.execute("SELECT state FROM tables WHERE path = ?", (path,)).fetchone()
+        return json.loads(row[0])
+
+    def problems(self, path):
+        """Return the saved problems of a table."""
+        row = self.conn.execute("SELECT problems FROM tables WHERE path = ?", (path,)).fetchone()
+        return json.loads(row[0])
+
+    def save(self, path, state, problems):
+        """Save the state of a table and its list of problems."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO tables VALUES (?, ?, ?, ?, ?)",
+            (
+                path,
+                self.version,
+                json.dumps(state["stat"]),
+                # dumps uses the C encoder, dump does not
+                json.dumps(state, separators=(",", ":")),
+                json.dumps(problems, separators=(",", ":")),
+            ),
+        )
+
+    def close(self, paths):
+        """Forget the tables that are not at the given paths,
+        and commit everything that was saved in one transaction."""
+        paths = set(paths)
+        forget = [(p,) for p, in self.conn.execute("SELECT path FROM tables") if p not in paths]
+        self.conn.executemany("DELETE FROM tables WHERE path = ?", forget)
+        self.conn.commit()
+        self.conn.close()
+
+
+def table_state(saved, headers):
+    """Return the saved state for a table, reset if its headers have changed."""
+    if not saved or saved.get("headers") != headers:
+        saved = {"headers": headers}
+    return saved
+
+
+def check_template(template, saved, label_to_curie, obsolete, hashed=True, enabled=()):
+    """Check a template against the index labels,
+    starting from its saved state (or None),
+    and return its updated state and the rule stats.
+    Rows are keyed by hashes of their values if `hashed`,
+    otherwise by position, when the state will not be saved.
+    Rules that are off by default run if they are `enabled`."""
+    stat = file_stat(template)
+    # Required: Label, Parent
+    # Optional: Definition, Alternative Term
+    headers, rows = read_table(template)
+    saved = table_state(saved, headers)
+    columns = Columns(headers)
+    row_rules, aggregate_rules = table_rules("template", columns, enabled)
+    stats = RuleStats()
+
+    # Rows are checked only for non-obsolete terms with a unique label,
+    # so the term's ID is part of each row's key.
+    # Empty lines are skipped, but keep their row numbers.
+    keys = []
+    curies = []
+    for row in rows:
+        curie = label_to_curie.get(columns.value(row, "Label")) if row else None
+        if curie is None or curie in obsolete:
+            keys.append(None)
+        else:
+            keys.append(row_key(row, curie) if hashed else len(keys))
+        curies.append(curie)
+
+    def check(indices):
+        checked = [rows[i] for i in indices]
+        problems = check_rows(stats, row_rules, columns, checked)
+        entries = stats.run_entries(
+            template_entries, [(columns, row, curies[i]) for row, i in zip(checked, indices)]
+        )
+        return zip(problems, entries)
+
+    with gc_paused():
+        update_table(saved, keys, check, aggregate_rules, stats)
+    saved["stat"] = stat
+    return saved, stats
+
+
+# Index labels and obsolete terms for worker processes,
+# sent once to each worker instead of with every template
+worker_index = None
+
+
+def init_worker(label_to_curie, obsolete, hashed, enabled):
+    global worker_index
+    worker_index = (label_to_curie, obsolete, hashed, enabled)
+
+
+def check_template_job(template, saved):
+    return check_template(template, saved, *worker_index)
+
+
+class TSVWriter:
+    """Write problems as TSV with a header row."""
+
+    def __init__(self, output):
+        self.output = output
+        self.writer = csv.DictWriter(
+            output, fieldnames=FIELDS, delimiter="\t", lineterminator="\n"
+        )
+        self.writer.writeheader()
+
+    def write(self, problem):
+        self.writer.writerow(problem)
+
+    def flush(self):
+        self.output.flush()
+
+    def close(self):
+        self.output.flush()
+
+
+class JSONLWriter:
+    """Write problems as JSON Lines, one object per problem."""
+
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, problem):
+        self.output.write(json.dumps({f: problem.get(f) for f in FIELDS}) + "\n")
+
+    def flush(self):
+        self.output.flush()
+
+    def close(self):
+        self.output.flush()
+
+
+class ArrowWriter:
+    """Write problems as Parquet or as an Arrow IPC stream,
+    one row group or record batch per BATCH_SIZE problems.
+    Requires pyarrow."""
+
+    def __init__(self, output, format):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception(f"pyarrow is required for {format} output")
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([(f, pyarrow.string()) for f in FIELDS])
+        if format == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(output, self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_stream(output, self.schema)
+        self.output = output
+        self.batch = []
+
+    def write(self, problem):
+        self.batch.append(problem)
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            table = self.pa.Table.from_pylist(self.batch, schema=self.schema)
+            self.writer.write_table(table)
+            self.batch = []
+        self.output.flush()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def problem_writer(format, path):
+    """Return a writer for problems in the given format, to a path or to stdout."""
+    if format in ["parquet", "arrow"]:
+        output = open(path, "wb") if path else sys.stdout.buffer
+        return ArrowWriter(output, format)
+    output = open(path, "w", newline="") if path else sys.stdout
+    if format == "jsonl":
+        return JSONLWriter(output)
+    return TSVWriter(output)
+
+
+class ProblemStream:
+    """Send problems to a writer as soon as each table is done,
+    keeping at most `limit` problems for each rule."""
+
+    def __init__(self, writer, limit=None):
+        self.writer = writer
+        self.limit = limit
+        self.counts = {}
+
+    def write_all(self, problems):
+        for problem in problems:
+            rule = problem["rule ID"]
+            count = self.counts.get(rule, 0) + 1
+            self.counts[rule] = count
+            if self.limit is None or count <= self.limit:
+                self.writer.write(problem)
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+        if self.limit is not None:
+            for rule, count in self.counts.items():
+                if count > self.limit:
+                    logging.warning(f"{count - self.limit} more problems for {rule} were not reported")
+
+
 def main():
     p = ArgumentParser()
     p.add_argument("-i", "--index", help="Path to index template")
     p.add_argument(
         "-t", "--templates", nargs="*", help="Paths to other templates to report on"
     )
+    p.add_argument(
+        "-s",
+        "--state",
+        help="Path to a SQLite state file: only rows that changed since the last run are re-checked",
+    )
+    p.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes to check templates in parallel",
+    )
+    p.add_argument(
+        "-f",
+        "--format",
+        choices=["tsv", "jsonl", "parquet", "arrow"],
+        default="tsv",
+        help="Output format (parquet and arrow require pyarrow)",
+    )
+    p.add_argument("-o", "--output", help="Path to write problems to (default: stdout)")
+    p.add_argument(
+        "-m",
+        "--max-per-rule",
+        type=int,
+        help="Maximum number of problems to report for each rule",
+    )
+    p.add_argument(
+        "-r",
+        "--rule-stats",
+        help="Path to write the time, calls, and hits for each rule that ran, "
+        "and for building the shared map entries that aggregate rules read",
+    )
+    p.add_argument(
+        "-e",
+        "--enable",
+        action="append",
+        default=[],
+        choices=[r.name for r in RULES if not r.default],
+        help="Name of a rule that is off by default to run as well (can be repeated)",
+    )
     args = p.parse_args()
 
-    # ID -> Label (loc -> value) to check for multiple labels
-    curie_to_labels = {}
-
-    # Label -> ID (loc -> ID) to check for duplicate labels
-    label_to_curies = {}
-
-    obsolete = []
+    stream = ProblemStream(problem_writer(args.format, args.output), args.max_per_rule)
 
-    problems = []
+    store = StateStore(args.state, args.enable) if args.state else None
+    stats = RuleStats()
 
-    # Read in index to collect ID -> Label
-    delim = "\t"
-    if args.index.endswith("csv"):
-        delim = ","
-    with open(args.index, "r") as f:
+    # Check the index, unless it is unchanged since the last run
+    index = None
+    index_touched = False
+    if store and store.stat(args.index) == file_stat(args.index):
+        stream.write_all(store.problems(args.index))
+    else:
+        stat = file_stat(args.index)
         # ID, Label, Type, obsolete, replacement
-        reader = csv.DictReader(f, delimiter=delim)
-        # Use headers to get the column idx
-        headers = reader.fieldnames
-        # Skip template string row
-        next(reader)
-        # Start at row idx 3; 1=headers, 2=template, 3=validate
-        row_idx = 2
-        for row in reader:
-            row_idx += 1
-            curie = row["ID"]
-            label = row["Label"]
-            if not label or label.strip() == "":
-                problems.append(
-                    {
-                        "table": args.index,
-                        "cell": idx_to_a1(row_idx, headers.index("Label") + 1),
-                        "level": "error",
-                        "rule ID": "ROBOT:report_queries/missing_label",
-                        "rule": "missing label",
-                        "message": "add a label",
-                    }
-                )
-                continue
+        headers, rows = read_table(args.index)
+        index = table_state(store and store.load(args.index), headers)
+        columns = Columns(headers)
+        row_rules, aggregate_rules = table_rules("index", columns, args.enable)
+        # Empty lines are skipped, as csv.DictReader did, but keep their row numbers
+        if store:
+            keys = [row_key(row) if row else None for row in rows]
+        else:
+            keys = [i if row else None for i, row in enumerate(rows)]
 
-            # Check for label whitespace
-            if label.strip() != label:
-                problems.append(
-                    {
-                        "table": args.index,
-                        "cell": idx_to_a1(row_idx, headers.index("Label") + 1),
-                        "level": "error",
-                        "rule ID": "ROBOT:report_queries/label_whitespace",
-                        "rule": "label whitespace",
-                        "suggestion": label.strip(),
-                        "message": "remove leading and trailing whitespace from label",
-                    }
-                )
+        def check(indices):
+            checked = [rows[i] for i in indices]
+            problems = check_rows(stats, row_rules, columns, checked)
+            entries = stats.run_entries(index_entries, [(columns, row) for row in checked])
+            return zip(problems, entries)
 
-            # Check for label formatting
-            if "\n" in label or "\t" in label:
-                problems.append(
-                    {
-                        "table": args.index,
-                        "cell": idx_to_a1(row_idx, headers.index("Label") + 1),
-                        "level": "error",
-                        "rule ID": "ROBOT:report_queries/label_formatting",
-                        "rule": "label formatting",
-                        "suggestion": label.replace("\n", " ").replace("\t", " "),
-                        "message": "remove new lines and tabs from label",
-                    }
-                )
+        with gc_paused():
+            update_table(index, keys, check, aggregate_rules, stats)
+        # Templates are checked again whenever their labels change,
+        # including when the index state was reset or missing
+        digest = labels_digest(*index_labels(index))
+        index_touched = index.get("labels") != digest
+        index["labels"] = digest
+        index["stat"] = stat
+        problems = list(table_problems(args.index, index, aggregate_rules))
+        if store:
+            store.save(args.index, index, problems)
+        stream.write_all(problems)
 
-            # Add to CURIE -> Label map
-            if curie in curie_to_labels:
-                labels = curie_to_labels[curie]
-            else:
-                labels = {}
-            labels[idx_to_a1(row_idx, headers.index("Label") + 1)] = label
-            curie_to_labels[curie] = labels
+    # Templates that are unchanged, and were checked against the same labels,
+    # keep their saved problems
+    pending = [
+        template
+        for template in args.templates
+        if not store or index_touched or store.stat(template) != file_stat(template)
+    ]
+    label_to_curie = {}
+    obsolete = set()
+    if pending:
+        if index is None:
+            index = store.load(args.index)
+        label_to_curie, obsolete = index_labels(index)
 
-            # Add to Label -> CURIE map
-            if label in label_to_curies:
-                curies = label_to_curies[label]
+    # Templates are independent once the labels are known,
+    # so they can be checked in any order.
+    # Each one is written out as soon as it and the templates before it are done.
+    pool = None
+    if args.jobs > 1 and len(pending) > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=min(args.jobs, len(pending)),
+            initializer=init_worker,
+            initargs=(label_to_curie, obsolete, bool(store), args.enable),
+        )
+        futures = {
+            t: pool.submit(check_template_job, t, store and store.load(t)) for t in pending
+        }
+    pending = set(pending)
+    try:
+        for template in args.templates:
+            if template not in pending:
+                stream.write_all(store.problems(template))
+                continue
+            if pool:
+                table, template_stats = futures[template].result()
             else:
-                curies = {}
-            curies[idx_to_a1(row_idx, headers.index("Label") + 1)] = curie
-            label_to_curies[label] = curies
-
-            # Obsolete checks
-            if row["obsolete"].lower() == "true":
-                obsolete.append(curie)
-                # Check for missing obsolete labels
-                if not label.lower().startswith("obsolete"):
-                    problems.append(
-                        {
-                            "table": args.index,
-                            "cell": idx_to_a1(row_idx, headers.index("Label") + 1),
-                            "level": "warn",
-                            "rule ID": "ROBOT:report_queries/missing_obsolete_label",
-                            "rule": "missing obsolete label",
-                            "suggestion": f"obsolete {label}",
-                            "message": "add obsolete to beginning of label",
-                        }
-                    )
-            elif label.startswith("obsolete"):
-                # not obsolete = true, but label begins with 'obsolete'
-                problems.append(
-                    {
-                        "table": args.index,
-                        "cell": idx_to_a1(row_idx, headers.index("Label") + 1),
-                        "level": "error",
-                        "rule ID": "ROBOT:report_queries/misused_obsolete_label",
-                        "rule": "misused obsolete label",
-                        "suggestion": label.split(" ", 1)[1],
-                        "message": "remove obsolete from label or mark term as obsolete",
-                    }
+                table, template_stats = check_template(
+                    template,
+                    store and store.load(template),
+                    label_to_curie,
+                    obsolete,
+                    hashed=bool(store),
+                    enabled=args.enable,
                 )
+            stats.merge(template_stats)
+            _, aggregate_rules = table_rules("template", Columns(table["headers"]), args.enable)
+            problems = table_problems(template, table, aggregate_rules)
+            if store:
+                problems = list(problems)
+                store.save(template, table, problems)
+            stream.write_all(problems)
+    finally:
+        if pool:
+            pool.shutdown()
+    stream.close()
 
-    # Check for multiple labels
-    for curie, labels in curie_to_labels.items():
-        if len(labels) > 1:
-            all_locs = labels.keys()
-            for loc, label in labels.items():
-                other_locs = ", ".join([x for x in all_locs if x != loc])
-                problems.append(
-                    {
-                        "table": args.index,
-                        "cell": loc,
-                        "level": "error",
-                        "rule ID": "ROBOT:report_queries/multiple_labels",
-                        "rule": "multiple labels",
-                        "message": f"select one label from this & {other_locs}",
-                    }
-                )
-
-    # Check for duplicate labels
-    for label, curies in label_to_curies.items():
-        if len(curies) > 1:
-            all_locs = curies.keys()
-            for loc, curie in curies.items():
-                other_locs = ", ".join([x for x in all_locs if x != loc])
-                problems.append(
-                    {
-                        "table": args.index,
-                        "cell": loc,
-                        "level": "error",
-                        "rule ID": "ROBOT:report_queries/duplicate_label",
-                        "rule": "duplicate label",
-                        "suggestion": f"",
-                        "message": f"assign unique labels to this * {other_locs}",
-                    }
-                )
+    if args.rule_stats:
+        with open(args.rule_stats, "w") as f:
+            stats.write(f)
 
-    # Make a map of Label -> CURIE for non-duplicate labels
-    label_to_curie = {}
-    for label, curies in label_to_curies.items():
-        if len(curies) == 1:
-            label_to_curie[label] = list(curies.keys())[0]
-
-    for template in args.templates:
-        # ID -> definition (loc -> value) for multiple definitions
-        curie_to_definitions = {}
-
-        # definition -> loc for duplicate definitions
-        definition_to_locs = {}
-
-        # alt term -> loc for duplicate alt terms
-        alt_term_to_locs = {}
-
-        delim = "\t"
-        if template.endswith("csv"):
-            delim = ","
-        with open(template, "r") as f:
-            # Required: Label, Parent
-            # Optional: Definition, Alternative Term
-            reader = csv.DictReader(f, delimiter=delim)
-            headers = reader.fieldnames
-
-            # Skip template string row
-            next(reader)
-            row_idx = 2
-
-            for row in reader:
-                row_idx += 1
-                label = row["Label"]
-                if label not in label_to_curie:
-                    continue
-                curie = label_to_curie[label]
-
-                if curie in obsolete:
-                    # Ignore obsolete terms
-                    continue
-
-                # Generic checks
-                for h, value in row.items():
-                    if not h:
-                        break
-                    # Check for whitespace
-                    if value and value.strip() != "":
-                        if value.strip() != value:
-                            problems.append(
-                                {
-                                    "table": template,
-                                    "cell": idx_to_a1(row_idx, headers.index(h) + 1),
-                                    "level": "warn",
-                                    "rule ID": "ROBOT:report_queries/annotation_whitespace",
-                                    "rule": "annotation whitespace",
-                                    "suggestion": value.strip(),
-                                    "message": "remove leading and trailing whitespace",
-                                }
-                            )
-
-                if "Parent" in headers:
-                    if not row["Parent"] or row["Parent"].strip() == "":
-                        # No superclass
-                        problems.append(
-                            {
-                                "table": template,
-                                "cell": idx_to_a1(row_idx, headers.index("Parent") + 1),
-                                "level": "info",
-                                "rule ID": "ROBOT:report_queries/missing_superclass",
-                                "rule": "missing superclass",
-                                "message": "add a superclass or ignore this message",
-                            }
-                        )
-
-                if "Definition" in headers:
-                    definition = row["Definition"]
-                    loc = idx_to_a1(row_idx, headers.index("Definition") + 1)
-                    if not definition or definition.strip() == "":
-                        # No definition
-                        problems.append(
-                            {
-                                "table": template,
-                                "cell": loc,
-                                "level": "warn",
-                                "rule ID": "ROBOT:report_queries/missing_definition",
-                                "rule": "missing definition",
-                                "message": "add a definition",
-                            }
-                        )
-                    else:
-                        if not re.match(r"^[A-Z]", definition.strip()):
-                            problems.append(
-                                {
-                                    "table": template,
-                                    "cell": loc,
-                                    "level": "info",
-                                    "rule ID": "ROBOT:report_queries/lowercase_definition",
-                                    "rule": "lowercase definition",
-                                    "suggestion": definition.capitalize(),
-                                    "message": "capitalize the first letter of the definition",
-                                }
-                            )
-
-                        # Add ID -> def dict
-                        if curie in curie_to_definitions:
-                            defs = curie_to_definitions[curie]
-                        else:
-                            defs = {}
-                        defs[loc] = definition
-                        curie_to_definitions[curie] = defs
-
-                        # Add to def -> ID dict
-                        if definition in definition_to_locs:
-                            locs = definition_to_locs[definition]
-                        else:
-                            locs = []
-                        locs.append(loc)
-                        definition_to_locs[definition] = locs
-
-                if "Alternative Term" in headers:
-                    loc = idx_to_a1(row_idx, headers.index("Alternative Term") + 1)
-                    alt_terms = row["Alternative Term"]
-                    if alt_terms and alt_terms.strip() != "":
-                        alt_terms = alt_terms.split("|")
-                        for at in alt_terms:
-                            if at.strip != "":
-                                at = at.strip()
-                                if at in alt_term_to_locs:
-                                    locs = alt_term_to_locs[at]
-                                else:
-                                    locs = []
-                                locs.append(loc)
-                                alt_term_to_locs[at] = locs
-
-        # Check for multiple definitions
-        for curie, definitions in curie_to_definitions.items():
-            if len(definitions) > 1:
-                all_locs = definitions.keys()
-                for loc, definition in definitions.items():
-                    other_locs = ", ".join([x for x in all_locs if x != loc])
-                    problems.append(
-                        {
-                            "table": template,
-                            "cell": loc,
-                            "level": "error",
-                            "rule ID": "ROBOT:report_queries/multiple_definitions",
-                            "rule": "multiple definitions",
-                            "message": f"select one definition from this & {other_locs}",
-                        }
-                    )
-
-        # Check for duplicate definitions
-        for definition, locs in definition_to_locs.items():
-            if len(locs) > 1:
-                for loc in locs:
-                    other_locs = ", ".join([x for x in locs if x != loc])
-                    problems.append(
-                        {
-                            "table": template,
-                            "cell": loc,
-                            "level": "error",
-                            "rule ID": "ROBOT:report_queries/duplicate_definition",
-                            "rule": "duplicate definitions",
-                            "message": f"write unique definitions for this & {other_locs}",
-                        }
-                    )
-
-        # Check for duplicate alt terms (exact synonyms)
-        for alt_term, locs in alt_term_to_locs.items():
-            if len(locs) > 1:
-                for loc in locs:
-                    other_locs = ", ".join([x for x in locs if x != loc])
-                    problems.append(
-                        {
-                            "table": template,
-                            "cell": loc,
-                            "level": "warn",
-                            "rule ID": "ROBOT:report_queries/duplicate_exact_synonym",
-                            "rule": f"duplicate exact synonym '{alt_term}'",
-                            "message": f"assign unique synonyms to this & {other_locs}",
-                        }
-                    )
-
-    # Write problems table to stdout
-    writer = csv.DictWriter(
-        sys.stdout,
-        fieldnames=[
-            "table",
-            "cell",
-            "level",
-            "rule ID",
-            "rule",
-            "message",
-            "suggestion",
-        ],
-        delimiter="\t",
-        lineterminator="\n",
-    )
-    writer.writeheader()
-    writer.writerows(problems)
+    if store:
+        # Forget tables that were not checked this time
+        store.close([args.index] + args.templates)
 
 
 if __name__ == "__main__":
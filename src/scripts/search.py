@@ -0,0 +1,197 @@
+# In-memory typeahead search over labels, alternative terms, and IEDB terms,
+# built once from the LDTab tables in .nanobot.db or from the ROBOT templates.
+
+import bisect
+import os
+import re
+import sqlite3
+
+from templates import load_template
+
+
+# Predicates to index from LDTab tables, with their rank (lower is better)
+PREDICATES = {
+    'rdfs:label': 0,
+    'IAO:0000118': 1,  # alternative term
+    'OBI:9991118': 1,  # IEDB alternative term
+}
+
+# Template columns to index, with their rank
+COLUMNS = {
+    'Label': 0,
+    'Alternative Term': 1,
+    'Synonyms': 1,
+    'IEDB Term': 1,
+}
+
+# Match tiers, best first:
+# the whole name, the start of the name or of its words, or anywhere in the name
+EXACT, PREFIX, SUBSTRING = range(3)
+
+# Maximum number of candidates to consider in each tier
+MAX_CANDIDATES = 500
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+
+def normalize(text):
+    """Lowercase text and collapse whitespace."""
+    return ' '.join(text.lower().split())
+
+
+def trigrams(text):
+    """Return the set of trigrams in normalized text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """A prefix and trigram index over term names.
+    Each entry is a (CURIE, name, rank) triple,
+    where rank 0 is a label and rank 1 is a synonym."""
+
+    def __init__(self, entries):
+        self.curies = []
+        self.names = []
+        self.ranks = []
+        self.norms = []
+        self.tokens = []
+        self.labels = {}
+        seen = set()
+        for curie, name, rank in entries:
+            name = name.strip()
+            if not name or (curie, name) in seen:
+                continue
+            seen.add((curie, name))
+            self.curies.append(curie)
+            self.names.append(name)
+            self.ranks.append(rank)
+            self.norms.append(normalize(name))
+            self.tokens.append(TOKEN_PATTERN.findall(self.norms[-1]))
+            if rank == 0 and curie not in self.labels:
+                self.labels[curie] = name
+
+        # Sorted (normalized name, entry) pairs for whole-name prefix matches
+        self.by_name = sorted((norm, i) for i, norm in enumerate(self.norms))
+        self.name_keys = [x[0] for x in self.by_name]
+
+        # Sorted (word, entry) pairs for word prefix matches
+        self.by_word = sorted(
+            (word, i) for i, words in enumerate(self.tokens) for word in set(words)
+        )
+        self.word_keys = [x[0] for x in self.by_word]
+
+        # Trigram -> entries for substring matches
+        self.grams = {}
+        for i, norm in enumerate(self.norms):
+            for gram in trigrams(norm):
+                self.grams.setdefault(gram, []).append(i)
+
+    @classmethod
+    def from_database(cls, path, table):
+        """Build an index from an LDTab table."""
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            placeholders = ', '.join('?' for _ in PREDICATES)
+            rows = conn.execute(
+                f'''SELECT subject, predicate, object FROM {table}
+                    WHERE predicate IN ({placeholders})
+                      AND subject NOT LIKE '_:%'
+                      AND assertion > 0 AND retraction = 0''',
+                list(PREDICATES),
+            ).fetchall()
+        finally:
+            conn.close()
+        return cls((s, o, PREDICATES[p]) for s, p, o in rows)
+
+    @classmethod
+    def from_templates(cls, template_dir):
+        """Build an index from the ROBOT templates.
+        Templates without an ID column are matched to IDs by label,
+        using the index and external templates."""
+        label_to_curie = {}
+        entries = []
+        tables = sorted(f for f in os.listdir(template_dir) if f.endswith('.tsv'))
+        # Read templates with IDs first
+        tables.sort(key=lambda f: f not in ['index.tsv', 'external.tsv'])
+        for table in tables:
+            template = load_template(os.path.join(template_dir, table))
+            if 'Label' not in template.index:
+                continue
+            for i in range(len(template)):
+                label = template.value(i, 'Label')
+                curie = template.value(i, 'ID') or label_to_curie.get(label)
+                if not curie:
+                    continue
+                label_to_curie.setdefault(label, curie)
+                for column, rank in COLUMNS.items():
+                    for name in (template.value(i, column) or '').split('|'):
+                        entries.append((curie, name, rank))
+        return cls(entries)
+
+    def search(self, text, limit=20):
+        """Given search text and a maximum number of results,
+        return a ranked list of result dicts with `id`, `label`, and `order`.
+        Results are ranked by match tier (exact, prefix of the name or its words, substring),
+        then labels before synonyms, then shorter names."""
+        query = normalize(text)
+        if not query:
+            return []
+
+        best = {}
+
+        def consider(i, tier):
+            key = (tier, self.ranks[i], len(self.norms[i]), self.norms[i])
+            curie = self.curies[i]
+            if curie not in best or key < best[curie][0]:
+                best[curie] = (key, i)
+
+        # Whole-name prefix matches
+        start = bisect.bisect_left(self.name_keys, query)
+        for norm, i in self.by_name[start:start + MAX_CANDIDATES]:
+            if not norm.startswith(query):
+                break
+            consider(i, EXACT if norm == query else PREFIX)
+
+        # Every query word is a prefix of some word in the name,
+        # starting from the query word with the fewest matches
+        tokens = TOKEN_PATTERN.findall(query)
+        if tokens:
+            ranges = []
+            for token in tokens:
+                start = bisect.bisect_left(self.word_keys, token)
+                end = bisect.bisect_left(self.word_keys, token + '\uffff', start)
+                ranges.append((end - start, start, end, token))
+            _, start, end, chosen = min(ranges)
+            # Words in the range start with the chosen token (and so with its prefixes),
+            # so only check the other tokens
+            others = [t for t in tokens if not chosen.startswith(t)]
+            for _, i in self.by_word[start:min(end, start + MAX_CANDIDATES)]:
+                if others:
+                    words = self.tokens[i]
+                    if not all(any(w.startswith(t) for w in words) for t in others):
+                        continue
+                consider(i, PREFIX)
+
+        # Substring matches, using trigrams to find candidates
+        if len(query) >= 3 and len(best) < limit:
+            postings = sorted((self.grams.get(g, []) for g in trigrams(query)), key=len)
+            if postings and postings[0]:
+                candidates = set(postings[0])
+                for posting in postings[1:]:
+                    candidates.intersection_update(posting)
+                    if not candidates:
+                        break
+                for i in sorted(candidates)[:MAX_CANDIDATES]:
+                    if query in self.norms[i]:
+                        consider(i, SUBSTRING)
+
+        ranked = sorted(best.items(), key=lambda x: x[1][0])[:limit]
+        results = []
+        for order, (curie, (_, i)) in enumerate(ranked, start=1):
+            if self.ranks[i] == 0:
+                result = {'id': curie, 'label': self.names[i], 'order': order}
+            else:
+                result = {'id': curie, 'label': self.labels.get(curie, self.names[i]), 'order': order}
+                result['synonym'] = self.names[i]
+            results.append(result)
+        return results
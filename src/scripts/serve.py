@@ -3,13 +3,42 @@
 # Serve HCC-KB development and curation site,
 # calling Nanobot to do the hard work.
 
+import atexit
 import csv
+import functools
+import inspect
+import hashlib
+import http.client
+import io
+import json
+import mimetypes
 import os
+import re
+import signal
+import socket
 import subprocess
+import sys
+import threading
+import time
 
-from bottle import get, post, request, response, run, static_file, HTTPError
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+from bottle import (
+    get, http_date, install, parse_date, parse_range_header, post, request, response, run,
+    static_file,
+    HTTPError, HTTPResponse,
+)
 from jinja2 import Environment, FileSystemLoader
 from markdown import markdown
+from metrics import Metrics
+from search import SearchIndex
+from terms import TermLookup
+
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
 
 
 resources = {
@@ -27,9 +56,659 @@ env = Environment(
     loader=FileSystemLoader('src/templates/')
 )
 
+# Wrap content in the `page.html` template.
+# This is compiled once; Jinja reloads `page.html` itself when it changes.
+PAGE_SOURCE = '''{% extends "page.html" %}
+{% block content %}
+    {{ content }}
+{% endblock %}'''
+page_template = env.from_string(PAGE_SOURCE)
+
+# Sources of the pages that are not built from the ontology
+PAGE_HTML = 'src/templates/page.html'
+API_DOC = 'doc/api.md'
+
+# Request timing and latency histograms, served at /metrics
+metrics = Metrics()
+
+# Long-lived `nanobot serve` process, when running with `--backend server`
+backend = None
+
+# Native lookups for single terms, when .nanobot.db exists
+terms = None
+
+# Typeahead search index over the ontology table, built at startup
+search_index = None
+
+# Default and maximum number of search results
+SEARCH_LIMIT = 40
+MAX_SEARCH_LIMIT = 200
+
+# Cache of rendered GET responses, unless running with `--cache-size 0`
+cache = None
+
+# Responses larger than this are not cached
+MAX_CACHED_BODY = 1024 * 1024
+
+VERSION_PATTERN = re.compile(r'owl:versionIRI rdf:resource="([^"]+)"')
+
+# Pre-compressed variants of downloads, in order of preference,
+# built by the `downloads` Makefile target
+ENCODINGS = [('zstd', '.zst'), ('gzip', '.gz')]
+
+mimetypes.add_type('application/rdf+xml', '.owl')
+
+# Size of the chunks read from Nanobot and sent to the client
+CHUNK_SIZE = 64 * 1024
+
+# Hop-by-hop and server-specific headers that we should not pass through
+SKIP_HEADERS = ['connection', 'content-length', 'date', 'keep-alive', 'server', 'transfer-encoding']
+
+
+class ResponseCache:
+    """A bounded LRU cache of response bodies and headers
+    that is cleared whenever the build version changes."""
+
+    def __init__(self, size):
+        self.size = size
+        self.version = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        """Return the entry for the key,
+        or None if it is missing or from an older version."""
+        with self.lock:
+            if version != self.version:
+                self.version = version
+                self.entries.clear()
+                return None
+            entry = self.entries.get(key)
+            if entry:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, entry):
+        """Add an entry for the key, evicting the least recently used entries."""
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+@functools.lru_cache(maxsize=4)
+def version_iri(path, mtime):
+    """Return the version IRI from the header of an OWL file,
+    or an empty string if it has none.
+    The file modification time is part of the cache key."""
+    with open(path) as f:
+        for line in f:
+            match = VERSION_PATTERN.search(line)
+            if match:
+                return match.group(1)
+            if '</owl:Ontology>' in line:
+                break
+    return ''
+
+
+def build_version():
+    """Return the current build version
+    (the ontie.owl version IRI and the .nanobot.db modification time)
+    and the time that the build was last modified."""
+    version = []
+    modified = 0
+    for path in ['ontie.owl', '.nanobot.db']:
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            version.append(None)
+            continue
+        modified = max(modified, mtime)
+        version.append(version_iri(path, mtime) if path.endswith('.owl') else mtime)
+    return tuple(version), int(modified)
+
+
+def not_modified(etag, modified):
+    """Return True if the request's conditional headers
+    show that the client already has this response."""
+    if_none_match = request.get_header('If-None-Match')
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(',')]
+        return etag in tags or '*' in tags
+    if_modified_since = request.get_header('If-Modified-Since')
+    if if_modified_since:
+        since = parse_date(if_modified_since.split(';')[0].strip())
+        return since is not None and since >= modified
+    return False
+
+
+def make_etag(body):
+    """Return an ETag for a str or bytes body."""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def cache_stream(key, version, headers, chunks):
+    """Yield the chunks of a streamed body,
+    keeping a copy to add to the cache when the stream is done,
+    unless it grows larger than MAX_CACHED_BODY."""
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if parts is not None:
+            size += len(chunk)
+            parts.append(chunk)
+            if size > MAX_CACHED_BODY:
+                parts = None
+        yield chunk
+    if parts is not None:
+        body = b''.join(p if isinstance(p, bytes) else p.encode('utf-8') for p in parts)
+        cache.put(key, version, (body, headers, make_etag(body)))
+
+
+def cached(callback=None, sources=()):
+    """Decorate a GET route so that its responses
+    are served from the response cache,
+    with ETag and Last-Modified headers,
+    and 304 Not Modified for matching conditional requests.
+    Use `@cached(sources=paths)` for responses that also depend on other files:
+    their modification times are part of the cache key and of Last-Modified."""
+    if callback is None:
+        return functools.partial(cached, sources=sources)
+
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        if not cache:
+            return callback(*args, **kwargs)
+        version, modified = build_version()
+        mtimes = tuple(os.stat(path).st_mtime for path in sources)
+        modified = max([modified] + [int(mtime) for mtime in mtimes])
+        key = (request.method, request.path, request.query_string, mtimes)
+        entry = cache.get(key, version)
+        if entry:
+            body, headers, etag = entry
+            for name, value in headers:
+                response.add_header(name, value)
+        else:
+            body = callback(*args, **kwargs)
+            if response.status_code != 200:
+                return body
+            headers = list(response.headers.allitems())
+            if not isinstance(body, (str, bytes)):
+                # Cache a streamed body once it has been sent, if it is small enough
+                return cache_stream(key, version, headers, body)
+            if len(body) > MAX_CACHED_BODY:
+                return body
+            etag = make_etag(body)
+            cache.put(key, version, (body, headers, etag))
+        response.set_header('ETag', etag)
+        if modified:
+            response.set_header('Last-Modified', http_date(modified))
+        if not_modified(etag, modified):
+            response.status = 304
+            return ''
+        return body
+    return wrapper
+
+
+def timed(callback):
+    """A Bottle plugin that times every route,
+    including the time to send a streamed body,
+    and records the result in `metrics`."""
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        timer = metrics.start_request(request.method, request.route.rule, request.fullpath)
+        try:
+            body = callback(*args, **kwargs)
+        except HTTPResponse as e:
+            metrics.finish_request(timer, e.status_code)
+            raise
+        except Exception:
+            metrics.finish_request(timer, 500)
+            raise
+        if isinstance(body, HTTPResponse):
+            metrics.finish_request(timer, body.status_code)
+            return body
+        if inspect.isgenerator(body):
+            return finish_stream(timer, response.status_code, body)
+        metrics.finish_request(timer, response.status_code)
+        return body
+    return wrapper
+
+
+def finish_stream(timer, status, chunks):
+    """Yield the chunks of a streamed body,
+    and finish timing the request when it has been sent."""
+    try:
+        yield from chunks
+    finally:
+        metrics.finish_request(timer, status)
+
+
+install(timed)
+
+
+@get('/metrics')
+def get_metrics():
+    response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+    return metrics.render()
+
 
 @get('/')
+@cached(sources=[PAGE_HTML])
 def index():
+    return index_page.get()
+
+
+@get('/documentation')
+@cached(sources=[PAGE_HTML, API_DOC])
+def documentation():
+    return documentation_page.get()
+
+
+@get('/search')
+def search():
+    response.content_type = 'application/json'
+    return json.dumps(search_results(request.query.decode()))
+
+
+@get('/file/<filename>')
+def get_file(filename):
+    root = 'build/download/'
+    path = os.path.join(root, filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    # Use a pre-compressed variant if the client accepts it
+    # and it is at least as new as the file itself
+    name = filename
+    encoding = None
+    accepted = accepted_encodings()
+    for enc, extension in ENCODINGS:
+        if enc in accepted and is_fresh(path + extension, path):
+            name = filename + extension
+            encoding = enc
+            break
+
+    # Ranges are served from the file that static_file opens, not from its Python generator,
+    # so that the server's wsgi.file_wrapper can send them
+    range_header = request.environ.pop('HTTP_RANGE', None)
+    try:
+        res = static_file(name, root=root, mimetype=mimetype)
+    finally:
+        if range_header is not None:
+            request.environ['HTTP_RANGE'] = range_header
+    res.set_header('Vary', 'Accept-Encoding')
+    if encoding:
+        res.set_header('Content-Encoding', encoding)
+    if range_header and res.status_code == 200:
+        return file_range(res, range_header)
+    return res
+
+
+def file_range(res, range_header):
+    """Turn a static_file response into a 206 response for the first range in a Range header,
+    or into 416 if there is none that fits. The body is the open file, or '' for HEAD."""
+    length = int(res.get_header('Content-Length'))
+    ranges = list(parse_range_header(range_header, length))
+    if not ranges:
+        if res.body:
+            res.body.close()
+        return HTTPError(416, 'Requested Range Not Satisfiable')
+    offset, end = ranges[0]
+    res.status = 206
+    res.set_header('Content-Range', f'bytes {offset}-{end - 1}/{length}')
+    res.set_header('Content-Length', str(end - offset))
+    if res.body:
+        res.body = FileRange(res.body, offset, end - offset)
+    return res
+
+
+def accepted_encodings():
+    """Return the set of content codings that the client accepts."""
+    accepted = set()
+    for part in request.get_header('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def is_fresh(variant, path):
+    """Return True if the variant file exists
+    and is not older than the file at path."""
+    try:
+        return os.stat(variant).st_mtime >= os.stat(path).st_mtime
+    except FileNotFoundError:
+        return False
+
+
+class FileRange:
+    """A read-only view of `length` bytes of a file starting at `offset`.
+    It supports seek and tell, so servers can hand it off
+    through wsgi.file_wrapper instead of iterating in a worker thread."""
+
+    def __init__(self, f, offset, length):
+        self.file = f
+        self.end = offset + length
+        self.file.seek(offset)
+
+    def read(self, size=-1):
+        remain = max(0, self.end - self.file.tell())
+        if size is None or size < 0 or size > remain:
+            size = remain
+        return self.file.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_END:
+            return self.file.seek(self.end + offset)
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+@get('/<resource>')
+@cached
+def get_resource(resource):
+    return nanobot('GET', resource, '')
+
+
+@get('/<resource>/<path:path>')
+@cached
+def get_resource_path(resource, path):
+    query = request.query.decode()
+    if search_index and resource == 'ontology' and path == 'owl:Class' \
+            and query.get('format') == 'json' and 'text' in query:
+        # Typeahead requests from page.html
+        response.content_type = 'application/json'
+        return json.dumps(search_results(query))
+    if terms:
+        with metrics.span('native'):
+            result = terms.get_term(resource.replace('-', '_'), path, query)
+        if result:
+            content_type, body = result
+            response.content_type = content_type
+            return body
+    return nanobot('GET', resource, path)
+
+
+@post('/<resource>/')
+def post_resource(resource):
+    table = resource.replace('-', '_')
+    if terms and terms.accepts_batch(table, request.query.decode()):
+        response.content_type = 'text/tab-separated-values'
+        return terms.resolve(table, io.TextIOWrapper(request.body, encoding='utf-8'))
+    return nanobot('POST', resource, '')
+
+
+def search_results(query):
+    """Given request query parameters with `text` and optional `limit`,
+    return a list of search results."""
+    if not search_index:
+        raise HTTPError(503, 'Search index is not available')
+    try:
+        limit = min(int(query.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+    except ValueError:
+        raise HTTPError(400, 'limit must be an integer')
+    with metrics.span('search'):
+        return search_index.search(query.get('text', ''), limit=limit)
+
+
+def nanobot(method, resource, path):
+    """Call Nanobot for the given resource, and path,
+    using the long-lived backend when there is one
+    and falling back to a CGI call otherwise."""
+    if method not in ['GET', 'POST']:
+        raise HTTPError(f'Bad method {method}')
+    resource = resource.replace('-','_')
+    path_info = resource
+    if path:
+        path_info = '/'.join([resource, path])
+
+    result = None
+    if backend:
+        try:
+            with metrics.span('backend'):
+                result = backend.request(
+                    method,
+                    path_info,
+                    request.query_string,
+                    request.body.getvalue(),
+                    content_type=request.content_type,
+                )
+        except (OSError, http.client.HTTPException):
+            # Answer this request by CGI, and restart the backend if it has died
+            threading.Thread(target=backend.start, daemon=True).start()
+    if not result:
+        result = nanobot_cgi(method, path_info)
+
+    status, headers, body = result
+    if status:
+        response.status = status
+    for name, value in headers:
+        response.set_header(name, value)
+    return body
+
+
+def nanobot_cgi(method, path_info):
+    """Call Nanobot as a CGI script for the given path,
+    returning the status, headers, and a generator over the body.
+    Headers are read as soon as Nanobot writes them,
+    and the body is streamed as Nanobot produces it."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [os.path.join(os.getcwd(), 'bin/nanobot')],
+        env={
+            'GATEWAY_INTERFACE': 'CGI/1.1',
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': request.query_string,
+        },
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    metrics.record_span('spawn', time.perf_counter() - start)
+    # Write the request body in the background so that a large body
+    # cannot block Nanobot while it writes output
+    threading.Thread(
+        target=write_input,
+        args=(proc.stdin, request.body.getvalue()),
+        daemon=True,
+    ).start()
+
+    status = None
+    headers = []
+    with metrics.span('headers'):
+        for line in proc.stdout:
+            line = line.decode('utf-8').rstrip('\r\n')
+            if line.strip() == '':
+                break
+            name, value = line.split(': ', 1)
+            if name == 'status':
+                status = value
+            else:
+                headers.append((name, value))
+    return status, headers, stream_cgi(proc, start)
+
+
+def write_input(stdin, data):
+    """Write data to a child process's stdin and close it."""
+    try:
+        stdin.write(data)
+        stdin.close()
+    except OSError:
+        # The child exited without reading its input
+        pass
+
+
+def stream_cgi(proc, start):
+    """Yield chunks of a CGI child process's output until it exits,
+    then record the process's wall-clock and CPU time."""
+    body_start = time.perf_counter()
+    finished = False
+    try:
+        while True:
+            chunk = proc.stdout.read1(CHUNK_SIZE)
+            if not chunk:
+                finished = True
+                break
+            yield chunk
+    finally:
+        metrics.record_span('body', time.perf_counter() - body_start)
+        proc.stdout.close()
+        if not finished:
+            # The client went away before the output was finished.
+            # Signal the process directly: it has not been reaped yet,
+            # but Popen.kill() would reap it and lose its resource usage.
+            os.kill(proc.pid, signal.SIGKILL)
+        cpu = reap(proc)
+        metrics.observe('serve_nanobot_process_seconds', time.perf_counter() - start)
+        if cpu is not None:
+            metrics.observe('serve_nanobot_cpu_seconds', cpu)
+
+
+def reap(proc):
+    """Wait for a child process to exit
+    and return the CPU time it used in seconds,
+    or None if it was already reaped."""
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        proc.wait()
+        return None
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    return usage.ru_utime + usage.ru_stime
+
+
+class NanobotServer:
+    """Run `nanobot serve` as a long-lived child process
+    with the database kept open,
+    and send requests to it over persistent HTTP connections
+    (one per server thread)."""
+
+    def __init__(self, port, timeout=60):
+        self.port = port
+        self.timeout = timeout
+        self.process = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def start(self):
+        """Start the Nanobot process if it is not running
+        and wait until it accepts connections."""
+        with self.lock:
+            if self.process and self.process.poll() is None:
+                return
+            self.process = subprocess.Popen(
+                [os.path.join(os.getcwd(), 'bin/nanobot'), 'serve'],
+                stdout=subprocess.DEVNULL,
+            )
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise Exception(f'nanobot serve exited with code {self.process.returncode}')
+                try:
+                    socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                    return
+                except OSError:
+                    time.sleep(0.1)
+            raise Exception(f'nanobot serve did not start on port {self.port}')
+
+    def stop(self):
+        """Stop the Nanobot process."""
+        with self.lock:
+            if self.process and self.process.poll() is None:
+                self.process.terminate()
+                self.process.wait()
+            self.process = None
+
+    def connection(self):
+        """Return the persistent connection for this thread."""
+        conn = getattr(self.local, 'connection', None)
+        if not conn:
+            conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+            self.local.connection = conn
+        return conn
+
+    def request(self, method, path_info, query_string, body, content_type=None):
+        """Send a request to Nanobot for the given path,
+        returning the status, headers, and a generator over the body."""
+        url = '/' + path_info
+        if query_string:
+            url += '?' + query_string
+        headers = {}
+        if content_type:
+            headers['Content-Type'] = content_type
+        conn = self.connection()
+        try:
+            conn.request(method, url, body=body or None, headers=headers)
+            res = conn.getresponse()
+        except (OSError, http.client.HTTPException):
+            # The connection may have been closed while idle, so try once more
+            conn.close()
+            conn.request(method, url, body=body or None, headers=headers)
+            res = conn.getresponse()
+        headers = [(k, v) for k, v in res.getheaders() if k.lower() not in SKIP_HEADERS]
+        return f'{res.status} {res.reason}', headers, self.stream(conn, res)
+
+    def stream(self, conn, res):
+        """Yield chunks of a Nanobot response as they arrive."""
+        try:
+            while True:
+                chunk = res.read1(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            if not res.isclosed():
+                # The client went away before the response was finished,
+                # so this connection cannot be reused
+                conn.close()
+
+
+def load_config():
+    """Return the configuration from nanobot.toml."""
+    with open('nanobot.toml', 'rb') as f:
+        return tomllib.load(f)
+
+
+def render(content):
+    """Given an HTML content string,
+    render the `page.html` template
+    and return the resulting HTML string."""
+    with metrics.span('render'):
+        return page_template.render(
+            page={
+                'project_name': 'IEDB Terminology',
+                'tables': {
+                },
+            },
+            table_name='ontology',
+            tree='ontology',
+            content=content
+        )
+
+
+def index_html():
+    """Render the home page."""
     output = [
         '<div class="container-lg pt-3">',
         '  <h2>IEDB Source of Terminology</h2>',
@@ -76,87 +755,142 @@ def index():
     return render('\n'.join(output))
 
 
-@get('/documentation')
-def documentation():
-    with open('doc/api.md') as f:
+def documentation_html():
+    """Render the API documentation page from Markdown."""
+    with open(API_DOC) as f:
         output = '<div class="container-lg">'
         output += markdown(f.read(), extensions=['fenced_code', 'codehilite'])
         output += '</div>'
         return render(output)
 
 
-@get('/file/<filename>')
-def get_file(filename):
-    return static_file(filename, root='build/download/')
-
+class StaticPage:
+    """A page that is rendered once,
+    and rendered again only when one of its source files changes."""
 
-@get('/<resource>')
-def get_resource(resource):
-    return nanobot('GET', resource, '')
+    def __init__(self, build, paths):
+        self.build = build
+        self.paths = paths
+        self.mtimes = None
+        self.html = None
+        self.lock = threading.Lock()
 
+    def get(self):
+        """Return the rendered page, rebuilding it if the sources have changed."""
+        mtimes = tuple(os.stat(path).st_mtime for path in self.paths)
+        with self.lock:
+            if mtimes != self.mtimes:
+                self.html = self.build()
+                self.mtimes = mtimes
+            return self.html
 
-@get('/<resource>/<path:path>')
-def get_resource_path(resource, path):
-    return nanobot('GET', resource, path)
 
+index_page = StaticPage(index_html, [PAGE_HTML])
+documentation_page = StaticPage(documentation_html, [PAGE_HTML, API_DOC])
 
-def nanobot(method, resource, path):
-    """Call Nanobot as a CGI script
-    for the given resource, and path."""
-    if method not in ['GET', 'POST']:
-        raise HTTPError(f'Bad method {method}')
-    resource = resource.replace('-','_')
-    path_info = resource
-    if path:
-        path_info = '/'.join([resource, path])
 
-    result = subprocess.run(
-        [os.path.join(os.getcwd(), 'bin/nanobot')],
-        env={
-            'GATEWAY_INTERFACE': 'CGI/1.1',
-            'REQUEST_METHOD': method,
-            'PATH_INFO': path_info,
-            'QUERY_STRING': request.query_string,
-        },
-        input=request.body.getvalue().decode('utf-8'),
-        text=True,
-        capture_output=True
+def main():
+    global backend, cache, search_index, terms
+    config = load_config()
+    serve_config = config.get('serve', {})
+    p = ArgumentParser()
+    p.add_argument('--host', default='0.0.0.0', help='Host to listen on')
+    p.add_argument('--port', type=int, default=3000, help='Port to listen on')
+    p.add_argument(
+        '--backend',
+        choices=['cgi', 'server'],
+        default='cgi',
+        help='Call Nanobot as a CGI script per request, or keep a `nanobot serve` process running '
+        'on the port in nanobot.toml, which must differ from --port',
     )
-    reading_headers = True
-    body = []
-    for line in result.stdout.splitlines():
-        if reading_headers and line.strip() == '':
-            reading_headers = False
-            continue
-        if reading_headers:
-            name, value = line.split(': ', 1)
-            if name == 'status':
-                response.status = value
-            else:
-                response.set_header(name, value)
-        else:
-            body.append(line)
-    return '\n'.join(body)
+    p.add_argument(
+        '--no-native',
+        action='store_true',
+        help='Send single-term requests to Nanobot instead of answering them from .nanobot.db',
+    )
+    p.add_argument(
+        '--cache-size',
+        type=int,
+        default=1000,
+        help='Number of GET responses to cache (0 to disable)',
+    )
+    p.add_argument(
+        '--server',
+        choices=['wsgiref', 'waitress'],
+        default=serve_config.get('server', 'wsgiref'),
+        help='WSGI server: single-threaded wsgiref, or multi-threaded waitress with keep-alive',
+    )
+    p.add_argument(
+        '--threads',
+        type=int,
+        default=serve_config.get('threads', 8),
+        help='Number of worker threads for waitress',
+    )
+    p.add_argument(
+        '--connection-limit',
+        type=int,
+        default=serve_config.get('connection_limit', 100),
+        help='Maximum open client connections for waitress; more wait in the listen backlog. '
+        'Requests on open connections queue for a thread without a limit',
+    )
+    p.add_argument(
+        '--backlog',
+        type=int,
+        default=serve_config.get('backlog', 1024),
+        help='Size of the listen backlog for waitress; the OS refuses or drops more connections',
+    )
+    p.add_argument(
+        '--slow-request',
+        type=float,
+        default=serve_config.get('slow_request'),
+        help='Log requests that take longer than this many milliseconds, with their spans',
+    )
+    args = p.parse_args()
 
+    # `nanobot serve` listens on the port in nanobot.toml
+    nanobot_port = config['nanobot'].get('port', 3000)
+    if args.backend == 'server' and nanobot_port == args.port:
+        p.error(
+            f'--backend server runs `nanobot serve` on port {nanobot_port} from nanobot.toml, '
+            'which is also the --port of this server: use another --port, e.g. --port 3001'
+        )
 
-def render(content):
-    """Given an HTML content string,
-    render the `page.html` template
-    and return the resulting HTML string."""
-    template = env.from_string('''{% extends "page.html" %}
-{% block content %}
-    {{ content }}
-{% endblock %}''')
-    return template.render(
-        page={
-            'project_name': 'IEDB Terminology',
-            'tables': {
-            },
-        },
-        table_name='ontology',
-        tree='ontology',
-        content=content
-    )
+    if args.slow_request is not None:
+        metrics.slow_request = args.slow_request / 1000
+
+    if args.cache_size > 0:
+        cache = ResponseCache(args.cache_size)
+
+    if os.path.exists('.nanobot.db'):
+        search_index = SearchIndex.from_database('.nanobot.db', 'ontology')
+    else:
+        search_index = SearchIndex.from_templates('src/ontology/templates')
+
+    index_page.get()
+    documentation_page.get()
+
+    if not args.no_native and os.path.exists('.nanobot.db'):
+        terms = TermLookup('.nanobot.db')
+
+    if args.backend == 'server':
+        backend = NanobotServer(nanobot_port)
+        backend.start()
+        atexit.register(backend.stop)
+        # Exit cleanly on SIGTERM so that the backend is stopped too
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if args.server == 'waitress':
+        run(
+            server='waitress',
+            host=args.host,
+            port=args.port,
+            threads=args.threads,
+            connection_limit=args.connection_limit,
+            backlog=args.backlog,
+        )
+    else:
+        run(host=args.host, port=args.port)
 
 
-run(host='0.0.0.0', port=3000)
+if __name__ == '__main__':
+    main()
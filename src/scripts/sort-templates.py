@@ -4,17 +4,19 @@
 
 import csv, os
 
+from templates import load_template
+
 
 def sort_template(path):
-    rows = []
     try:
-        with open(path, "r") as tsv:
-            rows = list(csv.reader(tsv, delimiter="\t"))
+        table = load_template(path)
     except Exception as e:
         print(f"Failed to read {path}")
         raise(e)
-    headers = rows[0:2]
-    terms = rows[2:]
+    headers = [table.headers]
+    if table.strings or len(table):
+        headers.append(table.strings)
+    terms = list(table)
     terms.sort(key=lambda x: x[0])
     with open(path, "w") as tsv:
         writer = csv.writer(tsv, delimiter="\t", lineterminator="\n")
@@ -37,4 +39,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,160 @@
+# Load ROBOT templates into compact, column-oriented tables,
+# parsing each file at most once per process while it is unchanged,
+# and append rows to templates under a file lock.
+
+import csv
+import fcntl
+import io
+import os
+
+from array import array
+from contextlib import contextmanager
+from itertools import zip_longest
+
+
+class Template:
+    """A ROBOT template: its headers, its template strings, and its data rows,
+    stored as one list of values for each column instead of a list for each row.
+    Data row i is row i + 3 of the file; 1=headers, 2=template strings."""
+
+    def __init__(self, path, headers, strings, rows):
+        self.path = path
+        self.headers = headers
+        self.strings = strings
+        # Header -> position of its first column
+        self.index = {}
+        for i, h in enumerate(headers):
+            self.index.setdefault(h, i)
+        # Rows keep their own length, so that they can be written back unchanged
+        self.widths = array("I", map(len, rows))
+        # Repeated values, like parents and types, share one string
+        values = {}
+        self.columns = [
+            [values.setdefault(v, v) for v in column]
+            for column in zip_longest(*rows, fillvalue="")
+        ]
+        self.by_value = {}
+
+    def __len__(self):
+        return len(self.widths)
+
+    def __getitem__(self, i):
+        """Return data row i as a list of values."""
+        return [column[i] for column in self.columns[: self.widths[i]]]
+
+    def __iter__(self):
+        for i in range(len(self.widths)):
+            yield self[i]
+
+    def column(self, name):
+        """Return the values of the named column for every data row,
+        with "" for rows that are too short, or None if there is no such column."""
+        i = self.index.get(name)
+        if i is None:
+            return None
+        if i >= len(self.columns):
+            return [""] * len(self)
+        return self.columns[i]
+
+    def value(self, i, name):
+        """Return the value of data row i in the named column,
+        or None if there is no such column or the row is too short."""
+        j = self.index.get(name)
+        if j is None or j >= self.widths[i]:
+            return None
+        return self.columns[j][i]
+
+    def record(self, i):
+        """Return data row i as a dict from header to value."""
+        return {h: self.value(i, h) for h in self.headers}
+
+    def find(self, name, value):
+        """Return the number of the first data row with a value in the named column,
+        or None if there is none."""
+        if name not in self.by_value:
+            rows = {}
+            for i in range(len(self)):
+                v = self.value(i, name)
+                if v:
+                    rows.setdefault(v, i)
+            self.by_value[name] = rows
+        return self.by_value[name].get(value)
+
+    def find_label(self, label):
+        """Return the number of the first data row with this label, or None."""
+        return self.find("Label", label)
+
+    def find_id(self, curie):
+        """Return the number of the first data row with this ID, or None."""
+        return self.find("ID", curie)
+
+
+# Absolute path -> (modification time, size, Template)
+loaded = {}
+
+
+def delimiter(path):
+    """Files ending in csv are comma-separated, the rest tab-separated."""
+    return "," if path.endswith("csv") else "\t"
+
+
+def read_template(path):
+    """Parse a template file."""
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter(path))
+        headers = next(reader, [])
+        strings = next(reader, [])
+        return Template(path, headers, strings, list(reader))
+
+
+def load_template(path):
+    """Return the parsed template at a path,
+    reusing the result of an earlier call unless the file has changed since."""
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    cached = loaded.get(key)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    template = read_template(path)
+    loaded[key] = (stat.st_mtime_ns, stat.st_size, template)
+    return template
+
+
+def read_headers(path):
+    """Return the headers and template strings of a template without reading its data rows."""
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter(path))
+        return next(reader, []), next(reader, [])
+
+
+@contextmanager
+def locked(paths):
+    """Hold an exclusive lock on each of the templates at the given paths,
+    and yield a dict from path to a file descriptor for appending to it.
+    Locks are always taken in the same order, so that two writers cannot deadlock."""
+    fds = {}
+    try:
+        for path in sorted(set(paths), key=os.path.abspath):
+            fds[path] = os.open(path, os.O_RDWR | os.O_APPEND)
+            fcntl.flock(fds[path], fcntl.LOCK_EX)
+        yield fds
+    finally:
+        for fd in fds.values():
+            os.close(fd)
+
+
+def append_rows(path, fd, headers, records):
+    """Append rows from dicts of values by header to a template, with one write,
+    using a file descriptor from locked(), and return the rows as lists.
+    Only the end of the file is read."""
+    rows = [[values.get(header, "") for header in headers] for values in records]
+    buffer = io.StringIO()
+    size = os.fstat(fd).st_size
+    if size and os.pread(fd, 1, size - 1) != b"\n":
+        buffer.write("\n")
+    writer = csv.writer(buffer, delimiter=delimiter(path), lineterminator="\n")
+    writer.writerows(rows)
+    data = buffer.getvalue().encode("utf-8")
+    while data:
+        data = data[os.write(fd, data) :]
+    return rows
@@ -0,0 +1,359 @@
+# Answer the common single-term requests
+# directly from the LDTab tables in .nanobot.db,
+# so that serve.py does not have to call Nanobot for them.
+
+import itertools
+import json
+import queue
+import re
+import sqlite3
+
+from contextlib import contextmanager
+
+
+# LDTab tables that we can answer term requests for
+TABLES = ['ontology', 'ontie', 'disease_tree']
+
+# Columns returned by default for a TSV term request
+DEFAULT_COLUMNS = ['IRI', 'label', 'recognized', 'obsolete', 'replacement']
+
+# Query parameters that we know how to handle
+# (anything else is left to Nanobot)
+PARAMETERS = ['select', 'show-headers', 'compact']
+
+# Predicates that come first in Turtle output
+FIRST_PREDICATES = ['rdf:type', 'rdfs:label']
+
+# Columns with a [CURIE] or [label] modifier, e.g. `replacement [label]`
+MODIFIER_PATTERN = re.compile(r'^(.+) \[(CURIE|label)\]$')
+
+# Query parameters for a batch lookup, e.g. POST /ontology/?method=GET&format=tsv
+BATCH_PARAMETERS = {'method': 'GET', 'format': 'tsv'}
+
+# Columns returned for a batch lookup
+BATCH_COLUMNS = ['CURIE', 'label', 'recognized', 'obsolete', 'replacement']
+
+# Number of CURIEs to insert into the batch table at a time
+BATCH_SIZE = 10000
+
+# Number of output lines to send to the client at a time
+CHUNK_LINES = 1000
+
+# Term paths like `ONTIE_0000001.tsv`
+TERM_PATTERN = re.compile(r'^([A-Za-z][A-Za-z0-9]*)_([^/.]+)\.(tsv|ttl)$')
+
+
+class ConnectionPool:
+    """A pool of read-only SQLite connections."""
+
+    def __init__(self, path, size=8):
+        self.path = path
+        self.size = size
+        self.pool = queue.LifoQueue()
+
+    def get(self):
+        """Borrow a connection from the pool,
+        opening a new one if none are free."""
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return sqlite3.connect(
+                f'file:{self.path}?mode=ro',
+                uri=True,
+                check_same_thread=False,
+                cached_statements=256,
+            )
+
+    def put(self, conn):
+        """Return a connection to the pool."""
+        if self.pool.qsize() < self.size:
+            self.pool.put(conn)
+        else:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a `with` block."""
+        conn = self.get()
+        try:
+            yield conn
+        finally:
+            self.put(conn)
+
+
+class TermLookup:
+    """Render single terms from LDTab tables as TSV or Turtle."""
+
+    def __init__(self, path, size=8):
+        self.pool = ConnectionPool(path, size=size)
+        with self.pool.connection() as conn:
+            self.prefixes = conn.execute('SELECT prefix, base FROM prefix').fetchall()
+            names = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        self.bases = dict(self.prefixes)
+        # Try the longest base first when contracting IRIs
+        self.contractions = sorted(self.prefixes, key=lambda x: len(x[1]), reverse=True)
+        self.tables = [t for t in TABLES if (t,) in names]
+
+    def expand(self, curie):
+        """Given a CURIE, return an IRI."""
+        if ':' not in curie:
+            return curie
+        prefix, local = curie.split(':', 1)
+        if prefix in self.bases:
+            return self.bases[prefix] + local
+        return curie
+
+    def contract(self, iri):
+        """Given an IRI, return a CURIE."""
+        for prefix, base in self.contractions:
+            if iri.startswith(base):
+                return f'{prefix}:{iri[len(base):]}'
+        return iri
+
+    def get_term(self, table, path, query):
+        """Given a table name, a request path, and the request query parameters,
+        return a (content type, body) pair,
+        or None if the request should be handled by Nanobot."""
+        if table not in self.tables:
+            return None
+        match = TERM_PATTERN.match(path)
+        if not match:
+            return None
+        if any(k not in PARAMETERS for k in query.keys()):
+            return None
+        prefix, local, fmt = match.groups()
+        if prefix not in self.bases:
+            return None
+        curie = f'{prefix}:{local}'
+
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f'''SELECT predicate, object, datatype, annotation
+                    FROM {table}
+                    WHERE subject = ? AND assertion > 0 AND retraction = 0
+                    ORDER BY rowid''',
+                (curie,),
+            ).fetchall()
+            if fmt == 'tsv':
+                body = self.render_tsv(conn, table, curie, rows, query)
+                return ('text/tab-separated-values', body) if body is not None else None
+            body = self.render_ttl(curie, rows)
+            return ('text/turtle', body) if body is not None else None
+
+    def accepts_batch(self, table, query):
+        """Given a table name and the request query parameters,
+        return True if this is a batch lookup that we can resolve."""
+        return table in self.tables and dict(query) == BATCH_PARAMETERS
+
+    def resolve(self, table, lines):
+        """Given a table name and an iterable of lines
+        (a `CURIE` header and then one CURIE per line),
+        load the CURIEs into a temporary table,
+        and return a generator of TSV lines in input order
+        with the default columns for each CURIE."""
+        conn = self.pool.get()
+        try:
+            predicates = {
+                column: self.predicate_for(conn, table, column)
+                for column in ['label', 'obsolete', 'replacement']
+            }
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS batch(idx INTEGER PRIMARY KEY, curie TEXT)')
+            conn.execute('DELETE FROM temp.batch')
+            curies = (line.strip() for line in lines)
+            curies = ((c,) for c in curies if c and c != 'CURIE')
+            while True:
+                chunk = list(itertools.islice(curies, BATCH_SIZE))
+                if not chunk:
+                    break
+                conn.executemany('INSERT INTO temp.batch(curie) VALUES (?)', chunk)
+            cursor = conn.execute(
+                f"""SELECT b.idx, b.curie,
+                      EXISTS (SELECT 1 FROM {table} WHERE subject = b.curie) AS recognized,
+                      t.predicate, t.object, t.datatype
+                    FROM temp.batch AS b
+                    LEFT JOIN {table} AS t
+                      ON t.subject = b.curie
+                     AND t.predicate IN (?, ?, ?)
+                     AND t.assertion > 0 AND t.retraction = 0
+                    ORDER BY b.idx""",
+                (predicates['label'], predicates['obsolete'], predicates['replacement']),
+            )
+        except Exception:
+            self.pool.put(conn)
+            raise
+        return self.stream_batch(conn, cursor, predicates)
+
+    def stream_batch(self, conn, cursor, predicates):
+        """Given a connection, a cursor over the batch join, and the predicates for each column,
+        yield TSV lines for the input CURIEs in chunks,
+        then clear the batch table and return the connection to the pool."""
+        try:
+            chunk = ['\t'.join(BATCH_COLUMNS) + '\n']
+            for _, group in itertools.groupby(cursor, key=lambda r: r[0]):
+                values = {'label': set(), 'obsolete': set(), 'replacement': set()}
+                for _, curie, recognized, predicate, obj, datatype in group:
+                    for column, p in predicates.items():
+                        if predicate and predicate == p:
+                            values[column].add(self.expand(obj) if datatype == '_IRI' else obj)
+                chunk.append('\t'.join([
+                    curie,
+                    '|'.join(sorted(values['label'])),
+                    'true' if recognized else 'false',
+                    '|'.join(sorted(values['obsolete'])),
+                    '|'.join(sorted(values['replacement'])),
+                ]) + '\n')
+                if len(chunk) >= CHUNK_LINES:
+                    yield ''.join(chunk)
+                    chunk = []
+            yield ''.join(chunk)
+        finally:
+            cursor.close()
+            conn.execute('DELETE FROM temp.batch')
+            self.pool.put(conn)
+
+    def predicate_for(self, conn, table, column):
+        """Given a column name, return the predicate with that label,
+        or None if there is no such predicate."""
+        row = conn.execute(
+            f'''SELECT subject FROM {table}
+                WHERE predicate = 'rdfs:label' AND object = ?
+                LIMIT 1''',
+            (column,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def label_for(self, conn, table, curie):
+        """Given a CURIE, return its labels joined by pipes."""
+        labels = conn.execute(
+            f'''SELECT DISTINCT object FROM {table}
+                WHERE subject = ? AND predicate = 'rdfs:label'
+                ORDER BY object''',
+            (curie,),
+        ).fetchall()
+        return '|'.join(x[0] for x in labels)
+
+    def render_tsv(self, conn, table, curie, rows, query):
+        """Given a connection, table name, CURIE, LDTab rows, and query parameters,
+        return a TSV string, or None if a column cannot be rendered here."""
+        columns = DEFAULT_COLUMNS
+        if query.get('select'):
+            columns = query.get('select').split(',')
+        compact = query.get('compact') == 'true'
+
+        values = {}
+        for predicate, obj, datatype, _ in rows:
+            if datatype == '_JSON':
+                # Leave blank nodes to Nanobot
+                values.setdefault(predicate, None)
+                continue
+            values.setdefault(predicate, [])
+            if values[predicate] is not None:
+                values[predicate].append((obj, datatype))
+
+        cells = []
+        for column in columns:
+            if column == 'CURIE':
+                cells.append(curie)
+                continue
+            if column == 'IRI':
+                cells.append(self.expand(curie))
+                continue
+            if column == 'recognized':
+                cells.append('true' if rows else 'false')
+                continue
+            modifier = None
+            match = MODIFIER_PATTERN.match(column)
+            if match:
+                column, modifier = match.groups()
+            predicate = self.predicate_for(conn, table, column)
+            if not predicate:
+                return None
+            if predicate not in values:
+                cells.append('')
+                continue
+            if values[predicate] is None:
+                return None
+            objects = []
+            for obj, datatype in values[predicate]:
+                if datatype != '_IRI':
+                    objects.append(obj)
+                elif modifier == 'label':
+                    objects.append(self.label_for(conn, table, obj))
+                elif modifier == 'CURIE' or compact:
+                    objects.append(self.contract(obj))
+                else:
+                    objects.append(self.expand(obj))
+            cells.append('|'.join(sorted(set(objects))))
+
+        lines = []
+        if query.get('show-headers') != 'false':
+            lines.append('\t'.join(columns))
+        lines.append('\t'.join(cells))
+        return '\n'.join(lines) + '\n'
+
+    def render_ttl(self, curie, rows):
+        """Given a CURIE and LDTab rows, return a Turtle string,
+        or None if some rows are axiom annotations."""
+        if not rows or any(r[3] for r in rows):
+            return None
+        used = {'rdf', 'rdfs', 'xsd', 'owl', curie.split(':', 1)[0]}
+        statements = []
+        for predicate, obj, datatype, _ in sorted(rows, key=lambda r: predicate_order(r[0])):
+            statements.append((ttl_name(predicate, used), self.ttl_object(obj, datatype, used)))
+
+        if any(p not in self.bases for p in used):
+            return None
+
+        lines = [f'@prefix {p}: <{b}> .' for p, b in self.prefixes if p in used]
+        lines.append('')
+        lines.append(curie)
+        for i, (predicate, obj) in enumerate(statements):
+            sep = '  ' if i == 0 else '; '
+            lines.append(f'{sep}{predicate} {obj}')
+        lines.append('.')
+        return '\n'.join(lines) + '\n'
+
+    def ttl_object(self, obj, datatype, used):
+        """Given an LDTab object and datatype,
+        return the Turtle string for it,
+        adding any prefixes it uses to the `used` set."""
+        if datatype == '_IRI':
+            return ttl_name(obj, used)
+        if datatype == '_JSON':
+            return self.ttl_blank(json.loads(obj), used)
+        value = '"' + obj.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        if not datatype or datatype in ['_plain', 'xsd:string']:
+            return value
+        if datatype.startswith('@'):
+            return value + datatype
+        return f'{value}^^{ttl_name(datatype, used)}'
+
+    def ttl_blank(self, node, used):
+        """Given an LDTab JSON blank node, return an inline Turtle blank node."""
+        parts = []
+        for predicate in sorted(node, key=predicate_order):
+            name = ttl_name(predicate, used)
+            for value in node[predicate]:
+                obj = value['object']
+                datatype = value.get('datatype')
+                if isinstance(obj, dict):
+                    parts.append(f'{name} {self.ttl_blank(obj, used)}')
+                else:
+                    parts.append(f'{name} {self.ttl_object(obj, datatype, used)}')
+        return '[ ' + ' ; '.join(parts) + ' ]'
+
+
+def predicate_order(predicate):
+    """Sort key that puts rdf:type and rdfs:label first."""
+    if predicate in FIRST_PREDICATES:
+        return FIRST_PREDICATES.index(predicate)
+    return len(FIRST_PREDICATES)
+
+
+def ttl_name(curie, used):
+    """Given a CURIE or IRI, return the Turtle string for it,
+    adding its prefix to the `used` set."""
+    if curie.startswith('http://') or curie.startswith('https://'):
+        return f'<{curie}>'
+    used.add(curie.split(':', 1)[0])
+    return curie
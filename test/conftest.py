@@ -0,0 +1,5 @@
+# Let the unit tests import the scripts in src/scripts, as they import each other
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'scripts'))
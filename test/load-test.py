@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import argparse, os, socket, subprocess, sys, time
+
+from concurrent.futures import ThreadPoolExecutor
+from requests import Session
+
+# Run from the repository root, like serve.py
+SERVE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/scripts/serve.py')
+
+PATHS = [
+  '/ontology/ONTIE_0000001',
+  '/ontology/ONTIE_0000001.json',
+  '/ontology/ONTIE_0000001.ttl',
+  '/ontology/ONTIE_0000001.tsv',
+  '/ontology/ONTIE_0000008.tsv?select=CURIE,label,alternative%20term',
+]
+
+def wait_for(port, timeout=30):
+  '''Wait until a server accepts connections on the port.'''
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return
+    except OSError:
+      time.sleep(0.1)
+  raise Exception('serve.py did not start on port %d' % port)
+
+def client(root, count):
+  '''Send `count` requests over one keep-alive session
+  and return a list of (status, latency in ms) pairs.'''
+  results = []
+  with Session() as s:
+    for i in range(count):
+      start = time.perf_counter()
+      res = s.get(root + PATHS[i % len(PATHS)])
+      res.content
+      results.append((res.status_code, (time.perf_counter() - start) * 1000))
+  return results
+
+def load(root, concurrency, requests):
+  '''Run `concurrency` clients that send `requests` requests in total,
+  and return the throughput, error count, p50, and p99 latency.'''
+  start = time.perf_counter()
+  with ThreadPoolExecutor(concurrency) as pool:
+    futures = [pool.submit(client, root, requests // concurrency) for _ in range(concurrency)]
+    results = [r for f in futures for r in f.result()]
+  elapsed = time.perf_counter() - start
+  times = sorted(t for _, t in results)
+  errors = len([s for s, _ in results if s >= 500])
+  return (
+    len(results) / elapsed,
+    errors,
+    times[len(times) // 2],
+    times[min(len(times) - 1, int(len(times) * 0.99))])
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Start serve.py with different numbers of worker threads '
+                  'and measure how throughput scales')
+  parser.add_argument('-t', '--threads',
+      type=int,
+      nargs='+',
+      default=[1, 2, 4, 8],
+      help='the worker thread counts to try')
+  parser.add_argument('-c', '--concurrency',
+      type=int,
+      default=16,
+      help='the number of concurrent clients')
+  parser.add_argument('-n', '--requests',
+      type=int,
+      default=800,
+      help='the total number of requests per run')
+  parser.add_argument('-p', '--port',
+      type=int,
+      default=3200,
+      help='the port to start serve.py on')
+  parser.add_argument('serve_args',
+      nargs='*',
+      help='extra arguments for serve.py, e.g. -- --backend server')
+  args = parser.parse_args()
+
+  root = 'http://127.0.0.1:%d' % args.port
+  print('threads\tclients\treq/s\terrors\tp50 ms\tp99 ms')
+  for threads in args.threads:
+    proc = subprocess.Popen(
+      [sys.executable, SERVE,
+       '--server', 'waitress',
+       '--threads', str(threads),
+       '--port', str(args.port),
+       '--cache-size', '0'] + args.serve_args,
+      stdout=subprocess.DEVNULL,
+      stderr=subprocess.DEVNULL)
+    try:
+      wait_for(args.port)
+      throughput, errors, p50, p99 = load(root, args.concurrency, args.requests)
+      print('%d\t%d\t%.1f\t%d\t%.2f\t%.2f' % (
+        threads, args.concurrency, throughput, errors, p50, p99))
+    finally:
+      proc.terminate()
+      proc.wait()
+
+if __name__ == "__main__":
+  main()
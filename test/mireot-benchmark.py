@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import argparse, os, random, sqlite3, subprocess, sys, tempfile, time
+
+# Run from the repository root, like the Makefile
+MIREOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/scripts/mireot.py')
+PREFIXES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/scripts/prefixes.sql')
+
+def generate(path, classes, seed=0):
+  '''Write an LDTab-style statements database shaped like the DOID import:
+  a class hierarchy with some multiple parents and anonymous superclasses,
+  and labels, definitions, and synonyms for each class.'''
+  rng = random.Random(seed)
+  conn = sqlite3.connect(path)
+  with open(PREFIXES) as f:
+    conn.executescript(f.read())
+  conn.execute('''CREATE TABLE statements (
+    stanza TEXT, subject TEXT, predicate TEXT, object TEXT,
+    value TEXT, datatype TEXT, language TEXT)''')
+  rows = []
+  for i in range(1, classes + 1):
+    curie = 'DOID:%07d' % i
+    rows.append((curie, curie, 'rdf:type', 'owl:Class', None, None, None))
+    rows.append((curie, curie, 'rdfs:label', None, 'disease %d' % i, None, 'en'))
+    rows.append((curie, curie, 'IAO:0000115', None, 'A "disease" that\nis number %d.' % i, 'xsd:string', None))
+    for j in range(rng.randint(0, 3)):
+      rows.append((curie, curie, 'oio:hasExactSynonym', None, 'synonym %d of %d' % (j, i), None, None))
+    if i > 1:
+      for parent in {rng.randrange(1, i) for _ in range(rng.choice([1, 1, 1, 2]))}:
+        rows.append((curie, curie, 'rdfs:subClassOf', 'DOID:%07d' % parent, None, None, None))
+      if rng.random() < 0.2:
+        blank = '_:b%d' % i
+        rows.append((curie, curie, 'rdfs:subClassOf', blank, None, None, None))
+        rows.append((curie, blank, 'owl:onProperty', 'RO:0001025', None, None, None))
+        rows.append((curie, blank, 'owl:someValuesFrom', 'UBERON:0000061', None, None, None))
+  conn.executemany('INSERT INTO statements VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+  for column in ['stanza', 'subject', 'predicate', 'object', 'value']:
+    conn.execute('CREATE INDEX idx_%s ON statements (%s)' % (column, column))
+  conn.execute('ANALYZE')
+  conn.commit()
+  conn.close()
+
+def statements(output):
+  '''Return the statements in a Turtle file written by mireot.py as sorted lines,
+  one for each statement, whether or not statements about a subject are grouped with ';'.'''
+  lines = set()
+  subject = None
+  with open(output) as f:
+    for line in f:
+      line = line.rstrip('\n')
+      if line.startswith('@prefix'):
+        lines.add(line)
+        continue
+      body = line[:-2]
+      if line.startswith('    '):
+        lines.add('%s %s .' % (subject, body[4:]))
+      else:
+        subject = body.split(' ', 1)[0]
+        lines.add(body + ' .')
+  return sorted(lines)
+
+# Run a script and then print its peak memory use in KB to stderr.
+# On Linux, ru_maxrss keeps the peak from before exec, i.e. the memory of the benchmark itself,
+# so the high-water mark of the script's own address space is used when it is available.
+PEAK_MEMORY = '''import os, resource, runpy, sys
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if os.path.exists('/proc/self/status'):
+  with open('/proc/self/status') as f:
+    peak = int([line.split()[1] for line in f if line.startswith('VmHWM:')][0])
+sys.stderr.write('%d\\n' % peak)'''
+
+def run(script, database, terms, output, extra):
+  '''Run mireot.py and return its wall time in seconds, its peak memory in MB,
+  and its output statements.'''
+  start = time.perf_counter()
+  res = subprocess.run(
+    [sys.executable, '-c', PEAK_MEMORY, script, '-d', database, '-t', terms, '-o', output] + extra,
+    stderr=subprocess.PIPE,
+    check=True)
+  seconds = time.perf_counter() - start
+  return seconds, int(res.stderr.split()[-1]) / 1024, statements(output)
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Time mireot.py import extraction with different numbers of seed terms, '
+                  'on a synthetic DOID-like database or on a real one, e.g. build/doid.db')
+  parser.add_argument('-d', '--database',
+      help='an existing statements database to extract from (it is copied first); '
+           'by default a synthetic one is generated')
+  parser.add_argument('-c', '--classes',
+      type=int,
+      default=20000,
+      help='the number of classes in the synthetic database')
+  parser.add_argument('-s', '--seeds',
+      type=int,
+      nargs='+',
+      default=[10, 100, 1000],
+      help='the numbers of seed terms to extract')
+  parser.add_argument('-t', '--terms',
+      help='a file of seed terms to sample from, e.g. build/terms.txt; '
+           'by default seeds are sampled from the database')
+  parser.add_argument('-n', '--no-hierarchy',
+      action='store_true',
+      help='pass --no_hierarchy to mireot.py')
+  parser.add_argument('-a', '--annotation',
+      action='append',
+      default=[],
+      help='pass --annotation to mireot.py, e.g. -a rdfs:label -a IAO:0000115')
+  parser.add_argument('-r', '--read-only',
+      action='store_true',
+      help='pass --read-only to mireot.py, but not to the baseline')
+  parser.add_argument('-b', '--baseline',
+      help='another version of mireot.py to compare with, e.g. from '
+           '`git show <commit>:src/scripts/mireot.py > /tmp/mireot.py`; '
+           'both must write the same statements')
+  args = parser.parse_args()
+
+  extra = ['-n'] if args.no_hierarchy else []
+  for annotation in args.annotation:
+    extra += ['-a', annotation]
+  with tempfile.TemporaryDirectory() as directory:
+    database = os.path.join(directory, 'source.db')
+    if args.database:
+      with sqlite3.connect(args.database) as source, sqlite3.connect(database) as copy:
+        source.backup(copy)
+    else:
+      generate(database, args.classes)
+    if args.terms:
+      with open(args.terms) as f:
+        candidates = [line.strip() for line in f if line.strip()]
+    else:
+      with sqlite3.connect(database) as conn:
+        candidates = [row[0] for row in conn.execute(
+          "SELECT DISTINCT subject FROM statements WHERE subject NOT LIKE '_:%'")]
+    rng = random.Random(0)
+
+    # mireot.py leaves its extract table in the database,
+    # so the baseline gets its own copy, to start from the same state each time
+    baseline_database = os.path.join(directory, 'baseline.db')
+    if args.baseline:
+      with sqlite3.connect(database) as source, sqlite3.connect(baseline_database) as copy:
+        source.backup(copy)
+
+    if args.baseline:
+      print('seeds\tstatements\tbaseline s\tseconds\tspeedup\tbaseline MB\tMB')
+    else:
+      print('seeds\tstatements\tseconds\tMB')
+    for seeds in args.seeds:
+      terms = os.path.join(directory, 'terms.txt')
+      with open(terms, 'w') as f:
+        f.writelines(t + '\n' for t in rng.sample(candidates, min(seeds, len(candidates))))
+      output = os.path.join(directory, 'output.ttl')
+      seconds, memory, lines = run(MIREOT, database, terms, output, extra + (['-r'] if args.read_only else []))
+      if args.baseline:
+        before, before_memory, expected = run(args.baseline, baseline_database, terms, output, extra)
+        assert lines == expected, 'output with %d seeds differs from the baseline' % seeds
+        print('%d\t%d\t%.2f\t%.2f\t%.1fx\t%.0f\t%.0f' % (
+          seeds, len(lines), before, seconds, before / seconds, before_memory, memory))
+      else:
+        print('%d\t%d\t%.2f\t%.0f' % (seeds, len(lines), seconds, memory))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import argparse, os, sys, timeit
+
+# Run from the repository root, like serve.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/scripts'))
+import serve
+
+def uncompiled(build):
+  '''Given a page build function,
+  return a function that renders the page
+  while compiling the `page.html` wrapper on every call,
+  as serve.py did before templates were precompiled.'''
+  def render(content):
+    template = serve.env.from_string(serve.PAGE_SOURCE)
+    return template.render(
+      page={'project_name': 'IEDB Terminology', 'tables': {}},
+      table_name='ontology',
+      tree='ontology',
+      content=content)
+  def run():
+    original = serve.render
+    serve.render = render
+    try:
+      return build()
+    finally:
+      serve.render = original
+  return run
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Compare per-request rendering cost of the serve.py static pages')
+  parser.add_argument('-n', '--number',
+      type=int,
+      default=200,
+      help='the number of renders to time')
+  args = parser.parse_args()
+
+  pages = [
+    ('/', serve.index_html, serve.index_page),
+    ('/documentation', serve.documentation_html, serve.documentation_page),
+  ]
+  print('page\tbefore ms\tafter ms')
+  for path, build, page in pages:
+    page.get()
+    before = timeit.timeit(uncompiled(build), number=args.number)
+    after = timeit.timeit(page.get, number=args.number)
+    print('%s\t%.3f\t%.4f' % (
+      path,
+      before / args.number * 1000,
+      after / args.number * 1000))
+
+if __name__ == "__main__":
+  main()
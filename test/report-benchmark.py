@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import argparse, csv, os, random, subprocess, sys, tempfile, time
+
+# Run from the repository root, like the Makefile
+REPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/scripts/report.py')
+
+TEMPLATES = ['protein', 'taxon', 'disease', 'assays', 'complex', 'other']
+
+WORDS = '''antigen protein kinase receptor subunit alpha beta gamma chain fragment
+domain virus strain mouse human cell type disease assay binding epitope'''.split()
+
+def phrase(rng, n):
+  return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+def write_table(path, headers, template, rows):
+  with open(path, 'w', newline='') as f:
+    writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+    writer.writerow(headers)
+    writer.writerow(template)
+    writer.writerows(rows)
+
+def generate(directory, total, seed=0):
+  '''Write an index and templates with `total` terms in all,
+  with a sprinkling of the problems that report.py looks for,
+  and return the report.py arguments for them.'''
+  rng = random.Random(seed)
+  index = []
+  templates = {t: [] for t in TEMPLATES}
+  for i in range(total):
+    curie = 'ONTIE:%07d' % (i + 1)
+    label = '%s %d' % (phrase(rng, 3), i)
+    obsolete = ''
+    if rng.random() < 0.01:
+      label = 'obsolete ' + label
+      obsolete = 'true'
+    index.append([curie, label, 'owl:Class', obsolete, ''])
+    definition = phrase(rng, 12).capitalize() + '.'
+    if rng.random() < 0.01:
+      definition = definition.lower()
+    if rng.random() < 0.01:
+      definition = ''
+    alt_terms = '|'.join('%s %d' % (phrase(rng, 2), rng.randrange(total)) for _ in range(rng.randint(0, 3)))
+    parent = '' if rng.random() < 0.01 else index[rng.randrange(max(1, i))][1]
+    if rng.random() < 0.01:
+      parent += ' '
+    templates[TEMPLATES[i % len(TEMPLATES)]].append([label, parent, definition, alt_terms])
+
+  write_table(
+    os.path.join(directory, 'index.tsv'),
+    ['ID', 'Label', 'Type', 'obsolete', 'replacement'],
+    ['ID', 'LABEL', 'TYPE', 'AT obsolete^^xsd:boolean', 'AI replacement'],
+    index)
+  paths = []
+  for name, rows in templates.items():
+    path = os.path.join(directory, name + '.tsv')
+    write_table(
+      path,
+      ['Label', 'Parent', 'Definition', 'Alternative Term'],
+      ['LABEL', 'SC %', 'A IAO:0000115', 'A IAO:0000118 SPLIT=|'],
+      rows)
+    paths.append(path)
+  return ['--index', os.path.join(directory, 'index.tsv'), '--templates'] + paths
+
+def run(args):
+  '''Run report.py and return its wall time in seconds and its output.'''
+  start = time.perf_counter()
+  res = subprocess.run([sys.executable, REPORT] + args, capture_output=True, check=True)
+  return time.perf_counter() - start, res.stdout
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Time report.py on synthetic templates with different numbers of terms and jobs. '
+                  'With more than one --rows value, check that the time per row stays flat.')
+  parser.add_argument('-r', '--rows',
+      type=int,
+      nargs='+',
+      default=[100000],
+      help='the total numbers of terms across all templates, '
+           'e.g. 25000 50000 100000 200000 400000 to check scaling')
+  parser.add_argument('-j', '--jobs',
+      type=int,
+      nargs='+',
+      default=[1, 2, 4, len(TEMPLATES)],
+      help='the --jobs values to try')
+  parser.add_argument('-g', '--max-growth',
+      type=float,
+      default=1.5,
+      help='fail if the time per row at the largest size is more than this '
+           'many times the time per row at the smallest size')
+  args = parser.parse_args()
+
+  print('rows\tjobs\tseconds\tus/row\tproblems')
+  per_row = []
+  for rows in args.rows:
+    with tempfile.TemporaryDirectory() as directory:
+      report_args = generate(directory, rows)
+      expected = None
+      for jobs in args.jobs:
+        seconds, output = run(report_args + ['--jobs', str(jobs)])
+        if expected is None:
+          expected = output
+          per_row.append(seconds / rows)
+        assert output == expected, 'output with --jobs %d differs' % jobs
+        print('%d\t%d\t%.2f\t%.1f\t%d' % (
+          rows, jobs, seconds, seconds / rows * 1e6, output.count(b'\n') - 1))
+
+  if len(per_row) > 1:
+    growth = per_row[-1] / per_row[0]
+    print('time per row grew %.2fx from %d to %d rows' % (growth, args.rows[0], args.rows[-1]))
+    assert growth <= args.max_growth, 'report.py does not scale linearly'
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import argparse, statistics, time
+
+from requests import Session
+
+# Requests taken from test.py: (method, path, body)
+REQUESTS = [
+  ('GET', '/ontology/ONTIE_0000001', None),
+  ('GET', '/ontology/ONTIE_0000001.json', None),
+  ('GET', '/ontology/ONTIE_0000001.ttl', None),
+  ('GET', '/ontology/ONTIE_0000001.tsv', None),
+  ('GET', '/ontology/ONTIE_0000008.tsv?select=CURIE,label,alternative%20term', None),
+  ('POST', '/ontology/?method=GET&format=tsv', 'CURIE\nONTIE:0000001\nONTIE:0000002\n'),
+]
+
+def percentile(times, p):
+  '''Given a sorted list of times and a percentage,
+  return the time at that percentile.'''
+  idx = min(len(times) - 1, int(round(p / 100 * (len(times) - 1))))
+  return times[idx]
+
+def benchmark(root, rounds):
+  '''Given a root URL and a number of rounds,
+  send each request that many times
+  and return a sorted list of latencies in milliseconds.'''
+  times = []
+  with Session() as s:
+    for method, path, body in REQUESTS:
+      # Warm up
+      s.request(method, root + path, data=body)
+    for _ in range(rounds):
+      for method, path, body in REQUESTS:
+        start = time.perf_counter()
+        res = s.request(method, root + path, data=body)
+        res.content
+        times.append((time.perf_counter() - start) * 1000)
+  return sorted(times)
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Compare serve.py latency across running servers, '
+                  'e.g. one started with --backend cgi and one with --backend server')
+  parser.add_argument('roots',
+      nargs='+',
+      help='the root URLs to benchmark')
+  parser.add_argument('-n', '--rounds',
+      type=int,
+      default=50,
+      help='the number of times to send each request')
+  args = parser.parse_args()
+
+  print('root\trequests\tmean ms\tp50 ms\tp99 ms')
+  for root in args.roots:
+    times = benchmark(root.rstrip('/'), args.rounds)
+    print('%s\t%d\t%.2f\t%.2f\t%.2f' % (
+      root,
+      len(times),
+      statistics.mean(times),
+      percentile(times, 50),
+      percentile(times, 99)))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#
+# Check adding and importing terms, and the label index that add-term.py keeps up to date.
+# Run with: python3 -m pytest test/
+
+import importlib.util, os
+
+import pytest
+
+from label_index import LabelIndex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location(
+  'add_term', os.path.join(ROOT, 'src', 'scripts', 'add-term.py'))
+add_term = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(add_term)
+
+INDEX = '''ID\tLabel\tType\tobsolete\treplacement\tterm requester
+ID\tLABEL\tTYPE\tAT obsolete^^xsd:boolean\tAI replacement\tA ontology term requester
+ONTIE:0000001\tMus musculus BALB/c\towl:Class\t\t\tIEDB
+ONTIE:0000009\tMus musculus C57BL/6\towl:Class\t\t\tIEDB
+'''
+
+PROTEIN = '''Label\tParent\tAlternative Term
+LABEL\tSC %\tA alternative term SPLIT=|
+'''
+
+@pytest.fixture
+def templates(tmp_path, monkeypatch):
+  """Run in a directory with an index and a protein template."""
+  os.makedirs(str(tmp_path / 'src' / 'ontology' / 'templates'))
+  (tmp_path / 'src' / 'ontology' / 'templates' / 'index.tsv').write_text(INDEX)
+  (tmp_path / 'src' / 'ontology' / 'templates' / 'protein.tsv').write_text(PROTEIN)
+  monkeypatch.chdir(tmp_path)
+  return tmp_path / 'src' / 'ontology' / 'templates'
+
+def test_import(templates, tmp_path):
+  path = tmp_path / 'terms.tsv'
+  path.write_text('template\tID\tLabel\tParent\n'
+                  'protein\t\tprotein A\tprotein\n'
+                  'protein\tONTIE:0000100\tprotein B\tprotein\n'
+                  'protein\t\tprotein C\tprotein\n')
+  terms = add_term.read_terms(str(path))
+  assert add_term.add_terms(terms, 'build/label-index.db') == [
+    'ONTIE:0000101', 'ONTIE:0000100', 'ONTIE:0000102']
+  assert (templates / 'index.tsv').read_text().splitlines()[-3:] == [
+    'ONTIE:0000101\tprotein A\towl:Class\t\t\t',
+    'ONTIE:0000100\tprotein B\towl:Class\t\t\t',
+    'ONTIE:0000102\tprotein C\towl:Class\t\t\t',
+  ]
+  assert (templates / 'protein.tsv').read_text().splitlines()[-1] == 'protein C\tprotein\t'
+
+  # The label index was kept up to date with the new rows
+  index = LabelIndex('build/label-index.db')
+  try:
+    assert index.has_curie('ONTIE:0000102', add_term.INDEX)
+    assert index.labels('ONTIE:0000100', add_term.INDEX) == ['protein B']
+    assert index.last_number('ONTIE:', 7, add_term.INDEX) == 102
+  finally:
+    index.close()
+
+def test_duplicate_id(templates):
+  before = (templates / 'index.tsv').read_text()
+  terms = [
+    ('protein', None, {'Label': 'protein A'}),
+    ('protein', 'ONTIE:0000009', {'Label': 'protein B'}),
+  ]
+  with pytest.raises(ValueError) as e:
+    add_term.add_terms(terms, 'build/label-index.db')
+  assert 'ONTIE:0000009 (Mus musculus C57BL/6)' in str(e.value)
+  # Nothing was added
+  assert (templates / 'index.tsv').read_text() == before
+  assert (templates / 'protein.tsv').read_text() == PROTEIN
+
+def test_id_without_label(templates):
+  # Rows with an ID but no label still hold their ID
+  with open(str(templates / 'index.tsv'), 'a') as f:
+    f.write('ONTIE:0000020\t\towl:Class\t\t\t\n')
+  terms = [('protein', 'ONTIE:0000020', {'Label': 'protein A'})]
+  with pytest.raises(ValueError) as e:
+    add_term.add_terms(terms, 'build/label-index.db')
+  assert str(e.value) == 'Unable to add term; a term already exists with ID ONTIE:0000020 ()'
+  terms = [('protein', None, {'Label': 'protein A'})]
+  assert add_term.add_terms(terms, 'build/label-index.db') == ['ONTIE:0000021']
+
+def test_duplicate_label(templates):
+  # Only IDs are checked: a label may be reused, for example by a replacement term
+  terms = [('protein', None, {'Label': 'Mus musculus BALB/c'})]
+  assert add_term.add_terms(terms, 'build/label-index.db') == ['ONTIE:0000010']
+
+def test_read_problems(templates, tmp_path):
+  path = tmp_path / 'terms.jsonl'
+  path.write_text('{"template": "protein", "Label": "protein A"}\n'
+                  '{"template": "missing", "Label": "protein B"}\n'
+                  '\n'
+                  '{"template": "protein", "Label": "protein C", "Color": "red"}\n'
+                  '{"template": "protein"}\n')
+  with pytest.raises(ValueError) as e:
+    add_term.read_terms(str(path))
+  assert str(e.value).splitlines() == [
+    'Unable to add term; line 2: there is no template named missing',
+    'Unable to add term; line 4: template protein has no column Color',
+    'Unable to add term; line 5: a Label is required',
+  ]
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+#
+# Check request metrics and the slow request log.
+# Run with: python3 -m pytest test/
+
+import logging
+
+from metrics import Metrics
+
+def test_request(caplog):
+  metrics = Metrics(slow_request=None)
+  timer = metrics.start_request('GET', '/search', '/search?text=mus')
+  with metrics.span('search'):
+    pass
+  metrics.finish_request(timer, 200)
+  lines = metrics.render().splitlines()
+  assert 'serve_requests_total{route="/search",method="GET",status="200"} 1' in lines
+  assert 'serve_request_duration_seconds_count{route="/search",method="GET"} 1' in lines
+  assert 'serve_request_duration_seconds_bucket{route="/search",method="GET",le="+Inf"} 1' in lines
+  assert 'serve_span_duration_seconds_count{span="search"} 1' in lines
+  assert '# TYPE serve_request_duration_seconds histogram' in lines
+  assert not any(line.startswith('serve_slow_requests_total') for line in lines)
+  assert not caplog.records
+
+def test_slow_request(caplog):
+  metrics = Metrics(slow_request=0)
+  timer = metrics.start_request('GET', '/search', '/search?text=mus')
+  metrics.record_span('search', 0.25)
+  with caplog.at_level(logging.WARNING):
+    metrics.finish_request(timer, 200)
+  assert 'serve_slow_requests_total{route="/search",method="GET"} 1' in metrics.render().splitlines()
+  assert len(caplog.records) == 1
+  message = caplog.records[0].getMessage()
+  assert message.startswith('Slow request: ')
+  assert message.endswith(' GET /search?text=mus 200 search=250.0ms')
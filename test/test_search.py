@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+#
+# Check typeahead search ranking.
+# Run with: python3 -m pytest test/
+
+from search import SearchIndex
+
+ENTRIES = [
+  ('ONTIE:0000001', 'Mus musculus BALB/c', 0),
+  ('ONTIE:0000001', 'balb', 1),
+  ('ONTIE:0000002', 'Mus musculus BALB/c A2/Kb Tg', 0),
+  ('NCBITaxon:10090', 'Mus musculus', 0),
+  ('NCBITaxon:10090', 'mouse', 1),
+  ('NCBITaxon:10088', 'Mus', 0),
+  ('ONTIE:0000003', 'house mouse strain', 0),
+  ('ONTIE:0000004', 'Mouse', 1),
+]
+
+def ids(results):
+  return [r['id'] for r in results]
+
+def test_tiers():
+  index = SearchIndex(ENTRIES)
+  # Exact, then prefixes of the name, then prefixes of its words, shorter first
+  assert ids(index.search('mus')) == [
+    'NCBITaxon:10088', 'NCBITaxon:10090', 'ONTIE:0000001', 'ONTIE:0000002']
+  # Substring matches come last
+  assert ids(index.search('ous')) == ['ONTIE:0000003', 'NCBITaxon:10090', 'ONTIE:0000004']
+  assert ids(index.search('house')) == ['ONTIE:0000003']
+  assert ids(index.search('lb/c')) == ['ONTIE:0000001', 'ONTIE:0000002']
+
+def test_labels_before_synonyms():
+  index = SearchIndex(ENTRIES)
+  results = index.search('Mouse')
+  assert ids(results)[:2] == ['NCBITaxon:10090', 'ONTIE:0000004']
+  # A synonym match is shown with the term's label, and a term without a label keeps the synonym
+  assert results[0] == {'id': 'NCBITaxon:10090', 'label': 'Mus musculus', 'order': 1, 'synonym': 'mouse'}
+  assert results[1] == {'id': 'ONTIE:0000004', 'label': 'Mouse', 'order': 2, 'synonym': 'Mouse'}
+
+def test_words():
+  index = SearchIndex(ENTRIES)
+  # Every query word must start a word of the name, in any order
+  assert ids(index.search('balb mus')) == ['ONTIE:0000001', 'ONTIE:0000002']
+  assert ids(index.search('a2 balb tg')) == ['ONTIE:0000002']
+  assert index.search('balb rat') == []
+
+def test_each_term_once():
+  index = SearchIndex(ENTRIES)
+  # The best match for each term is kept
+  results = index.search('balb')
+  assert ids(results) == ['ONTIE:0000001', 'ONTIE:0000002']
+  assert results[0]['synonym'] == 'balb'
+
+def test_limit():
+  index = SearchIndex(ENTRIES)
+  assert ids(index.search('mus', limit=2)) == ['NCBITaxon:10088', 'NCBITaxon:10090']
+  assert [r['order'] for r in index.search('mus')] == [1, 2, 3, 4]
+  assert index.search('  ') == []
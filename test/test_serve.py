@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#
+# Check serve.py routes by calling the WSGI app directly, without a server or Nanobot.
+# Run with: python3 -m pytest test/
+
+import os, shutil
+
+import bottle, pytest, serve
+
+from wsgiref.util import setup_testing_defaults
+from search import SearchIndex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONTENT = b'0123456789abcdefghijklmnopqrstuvwxyz'
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+  """Run in a copy of the page sources, with an empty response cache and one download."""
+  shutil.copytree(os.path.join(ROOT, 'src', 'templates'), str(tmp_path / 'src' / 'templates'))
+  os.mkdir(str(tmp_path / 'doc'))
+  shutil.copy(os.path.join(ROOT, 'doc', 'api.md'), str(tmp_path / 'doc' / 'api.md'))
+  os.makedirs(str(tmp_path / 'build' / 'download'))
+  (tmp_path / 'build' / 'download' / 'test.txt').write_bytes(CONTENT)
+  monkeypatch.chdir(tmp_path)
+  monkeypatch.setattr(serve, 'cache', serve.ResponseCache(100))
+  return tmp_path
+
+def call(path, method='GET', headers={}, query='', environ=None):
+  """Call the app and return the status code, headers (with lowercase names), and body."""
+  environ = dict(environ or {})
+  setup_testing_defaults(environ)
+  environ['PATH_INFO'] = path
+  environ['QUERY_STRING'] = query
+  environ['REQUEST_METHOD'] = method
+  for name, value in headers.items():
+    environ['HTTP_' + name.upper().replace('-', '_')] = value
+  result = {}
+  def start_response(status, response_headers, exc_info=None):
+    result['status'] = int(status.split()[0])
+    result['headers'] = {k.lower(): v for k, v in response_headers}
+  body = bottle.default_app()(environ, start_response)
+  try:
+    data = b''.join(body)
+  finally:
+    if hasattr(body, 'close'):
+      body.close()
+  return result['status'], result['headers'], data
+
+def edit(path, old, new):
+  """Replace text in a file, and move its modification time forward."""
+  with open(path) as f:
+    text = f.read()
+  assert old in text
+  with open(path, 'w') as f:
+    f.write(text.replace(old, new))
+  mtime = os.stat(path).st_mtime + 10
+  os.utime(path, (mtime, mtime))
+
+def test_cached_page(site):
+  status, headers, body = call('/')
+  assert status == 200
+  etag = headers['etag']
+  assert call('/', headers={'If-None-Match': etag})[0] == 304
+  assert call('/')[2] == body
+
+def test_page_html_edit(site):
+  status, headers, body = call('/')
+  edit('src/templates/page.html', '</body>', '<!-- edited --></body>')
+  status, new_headers, new_body = call('/')
+  assert status == 200
+  assert b'<!-- edited -->' in new_body
+  assert new_headers['etag'] != headers['etag']
+  # The old ETag no longer matches
+  assert call('/', headers={'If-None-Match': headers['etag']})[0] == 200
+
+def test_api_doc_edit(site):
+  body = call('/documentation')[2]
+  assert b'Edited API' not in body
+  with open('doc/api.md', 'a') as f:
+    f.write('\n\nEdited API\n')
+  mtime = os.stat('doc/api.md').st_mtime + 10
+  os.utime('doc/api.md', (mtime, mtime))
+  assert b'Edited API' in call('/documentation')[2]
+  # The home page does not depend on api.md
+  assert call('/')[0] == 200
+
+def test_file(site):
+  status, headers, body = call('/file/test.txt')
+  assert status == 200
+  assert body == CONTENT
+  assert headers['content-length'] == str(len(CONTENT))
+
+@pytest.mark.parametrize('method', ['GET', 'HEAD'])
+@pytest.mark.parametrize('header,start,end', [
+  ('bytes=0-9', 0, 10),
+  ('bytes=-5', len(CONTENT) - 5, len(CONTENT)),
+  ('bytes=30-', 30, len(CONTENT)),
+  ('bytes=30-1000', 30, len(CONTENT)),
+])
+def test_file_range(site, method, header, start, end):
+  status, headers, body = call('/file/test.txt', method, {'Range': header})
+  assert status == 206
+  assert headers['content-range'] == f'bytes {start}-{end - 1}/{len(CONTENT)}'
+  assert headers['content-length'] == str(end - start)
+  assert body == (CONTENT[start:end] if method == 'GET' else b'')
+
+def test_file_range_wrapper(site):
+  # A range is sent from the open file, so the server can use wsgi.file_wrapper
+  files = []
+  def file_wrapper(f, size=8192):
+    files.append(f)
+    return iter(lambda: f.read(size), b'')
+  status, _, body = call('/file/test.txt', 'GET', {'Range': 'bytes=5-14'},
+                         environ={'wsgi.file_wrapper': file_wrapper})
+  assert status == 206
+  assert body == CONTENT[5:15]
+  assert len(files) == 1
+  files[0].close()
+
+@pytest.mark.parametrize('method', ['GET', 'HEAD'])
+def test_file_range_not_satisfiable(site, method):
+  assert call('/file/test.txt', method, {'Range': 'bytes=200-300'})[0] == 416
+
+def test_missing_file(site):
+  assert call('/file/missing.txt', 'GET', {'Range': 'bytes=0-9'})[0] == 404
+
+def test_search(site, monkeypatch):
+  monkeypatch.setattr(serve, 'search_index', SearchIndex([
+    ('NCBITaxon:10090', 'Mus musculus', 0),
+    ('NCBITaxon:10090', 'mouse', 1),
+    ('ONTIE:0000001', 'Mus musculus BALB/c', 0),
+  ]))
+  status, headers, body = call('/search', query='text=mus&limit=1')
+  assert status == 200
+  assert headers['content-type'] == 'application/json'
+  assert body == b'[{"id": "NCBITaxon:10090", "label": "Mus musculus", "order": 1}]'
+  # Typeahead requests from page.html get the same results
+  status, _, body = call('/ontology/owl:Class', query='format=json&text=mus&limit=1')
+  assert body == b'[{"id": "NCBITaxon:10090", "label": "Mus musculus", "order": 1}]'
+  assert call('/search', query='text=mus&limit=x')[0] == 400
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#
+# Check native term rendering against Nanobot output for the same LDTab rows.
+# Run with: python3 -m pytest test/
+
+import os, sqlite3
+
+from terms import TermLookup
+
+WWW = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'www')
+
+# The prefixes that Nanobot used for test/www/ONTIE_0000001.ttl, in order,
+# and one that the term does not use
+PREFIXES = [
+  ('rdf', 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'),
+  ('rdfs', 'http://www.w3.org/2000/01/rdf-schema#'),
+  ('xsd', 'http://www.w3.org/2001/XMLSchema#'),
+  ('owl', 'http://www.w3.org/2002/07/owl#'),
+  ('obo', 'http://purl.obolibrary.org/obo/'),
+  ('NCBITaxon', 'http://purl.obolibrary.org/obo/NCBITaxon_'),
+  ('ncbitaxon', 'http://purl.obolibrary.org/obo/ncbitaxon#'),
+  ('ONTIE', 'https://ontology.iedb.org/ontology/ONTIE_'),
+  ('IEDB', 'http://iedb.org/'),
+]
+
+# (subject, predicate, object, datatype) rows in LDTab order
+ROWS = [
+  ('ONTIE:0000001', 'rdf:type', 'owl:Class', '_IRI'),
+  ('ONTIE:0000001', 'rdfs:label', 'Mus musculus BALB/c', '_plain'),
+  ('ONTIE:0000001', 'obo:IAO_0000118', 'balb', '_plain'),
+  ('ONTIE:0000001', 'rdfs:subClassOf', 'NCBITaxon:10090', '_IRI'),
+  ('ONTIE:0000001', 'ncbitaxon:has_rank', 'NCBITaxon:subspecies', '_IRI'),
+  ('rdfs:label', 'rdfs:label', 'label', '_plain'),
+  ('owl:deprecated', 'rdfs:label', 'obsolete', '_plain'),
+  ('obo:IAO_0100001', 'rdfs:label', 'replacement', '_plain'),
+]
+
+def make_database(path, rows=ROWS):
+  conn = sqlite3.connect(path)
+  conn.execute('CREATE TABLE prefix (prefix TEXT PRIMARY KEY, base TEXT NOT NULL)')
+  conn.executemany('INSERT INTO prefix VALUES (?, ?)', PREFIXES)
+  conn.execute('''CREATE TABLE ontology (
+    assertion INTEGER, retraction INTEGER, graph TEXT,
+    subject TEXT, predicate TEXT, object TEXT, datatype TEXT, annotation TEXT)''')
+  conn.executemany(
+    "INSERT INTO ontology VALUES (1, 0, 'ONTIE', ?, ?, ?, ?, NULL)", rows)
+  conn.commit()
+  conn.close()
+  return TermLookup(path)
+
+def test_turtle_matches_nanobot(tmp_path):
+  terms = make_database(str(tmp_path / 'nanobot.db'))
+  with open(os.path.join(WWW, 'ONTIE_0000001.ttl')) as f:
+    expected = f.read()
+  assert terms.get_term('ontology', 'ONTIE_0000001.ttl', {}) == ('text/turtle', expected)
+
+def test_turtle_annotations_go_to_nanobot(tmp_path):
+  terms = make_database(str(tmp_path / 'nanobot.db'))
+  conn = sqlite3.connect(str(tmp_path / 'nanobot.db'))
+  conn.execute("UPDATE ontology SET annotation = '{}' WHERE predicate = 'obo:IAO_0000118'")
+  conn.commit()
+  conn.close()
+  assert terms.get_term('ontology', 'ONTIE_0000001.ttl', {}) is None
+
+def test_tsv(tmp_path):
+  terms = make_database(str(tmp_path / 'nanobot.db'))
+  assert terms.get_term('ontology', 'ONTIE_0000001.tsv', {}) == (
+    'text/tab-separated-values',
+    'IRI\tlabel\trecognized\tobsolete\treplacement\n'
+    'https://ontology.iedb.org/ontology/ONTIE_0000001\tMus musculus BALB/c\ttrue\t\t\n')
+  assert terms.get_term('ontology', 'ONTIE_0000001.tsv', {'select': 'CURIE,label'}) == (
+    'text/tab-separated-values', 'CURIE\tlabel\nONTIE:0000001\tMus musculus BALB/c\n')
+  assert terms.get_term('ontology', 'ONTIE_0000001.tsv', {'format': 'x'}) is None